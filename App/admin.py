@@ -1,6 +1,126 @@
-from django.contrib import admin
+from django.conf import settings
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import BooleanField, ExpressionWrapper, Max, Q
+from django.db.models.functions import Lower
+from django.utils.functional import cached_property
+
+from . import lyrics_events
 from .models import Song
 
+# Lyrics stored as the player's JSON (fetched or aligned) or as LRC text
+SYNCED_LYRICS = Q(lyrics__startswith='[{') | Q(lyrics__regex=r'^\[\d+:\d+')
+
+# SQLite's LOWER() only folds A-Z, so the search term must be folded the same way
+ASCII_LOWER = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')
+
+
+class ApproximateCountPaginator(Paginator):
+    """Paginator that never runs an unbounded COUNT(*)"""
+
+    # Filtered results are counted up to this many rows
+    count_limit = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            return self.estimate_table_rows(queryset)
+        return queryset.order_by()[:self.count_limit].count()
+
+    def estimate_table_rows(self, queryset):
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+                               [queryset.model._meta.db_table])
+                row = cursor.fetchone()
+            if row and row[0] > 0:
+                return row[0]
+        # Highest id: read straight from the primary key index, off only by deleted rows
+        return queryset.model.objects.using(queryset.db).aggregate(highest=Max('id'))['highest'] or 0
+
+
+class LyricsStatusFilter(admin.SimpleListFilter):
+    title = 'lyrics'
+    parameter_name = 'lyrics'
+
+    def lookups(self, request, model_admin):
+        return [
+            ('synced', 'Has synced lyrics'),
+            ('plain', 'Plain text only'),
+            ('none', 'No lyrics'),
+        ]
+
+    def queryset(self, request, queryset):
+        no_lyrics = Q(lyrics__isnull=True) | Q(lyrics='')
+        if self.value() == 'synced':
+            return queryset.filter(SYNCED_LYRICS)
+        if self.value() == 'plain':
+            return queryset.exclude(no_lyrics).exclude(SYNCED_LYRICS)
+        if self.value() == 'none':
+            return queryset.filter(no_lyrics)
+        return queryset
+
+
+@admin.register(Song)
+class SongAdmin(admin.ModelAdmin):
+    list_display = ('title', 'artist', 'duration', 'has_synced_lyrics')
+    list_filter = (LyricsStatusFilter,)
+    search_fields = ('title', 'artist')
+    search_help_text = 'Title or artist starting with... (accented letters must match case)'
+    ordering = ('-id',)
+    list_per_page = 50
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
+    actions = ['fetch_lyrics']
+
+    def get_queryset(self, request):
+        # The lyrics can be large: only the change form loads them
+        queryset = super().get_queryset(request).defer('lyrics')
+        return queryset.annotate(synced=ExpressionWrapper(SYNCED_LYRICS, output_field=BooleanField()))
+
+    def get_search_results(self, request, queryset, search_term):
+        """Prefix search on lower(title) / lower(artist), so the expression indexes are used"""
+        term = search_term.strip().translate(ASCII_LOWER)
+        if not term:
+            return queryset, False
+        end = term + '\U0010ffff'
+        queryset = queryset.alias(title_lower=Lower('title'), artist_lower=Lower('artist')).filter(
+            Q(title_lower__gte=term, title_lower__lt=end) | Q(artist_lower__gte=term, artist_lower__lt=end)
+        )
+        return queryset, False
+
+    @admin.display(boolean=True, description='Synced lyrics')
+    def has_synced_lyrics(self, song):
+        return song.synced
+
+    @admin.action(description='Fetch lyrics for selected songs')
+    def fetch_lyrics(self, request, queryset):
+        """Queue background lookups, up to MAX_PENDING_LOOKUPS; results are stored by lyrics_events"""
+        # Queued lookups only live in this worker's memory: the same cap as fetch_lyrics
+        # keeps the queue short enough to be done long before the worker is recycled
+        room = max(getattr(settings, 'MAX_PENDING_LOOKUPS', 50) - lyrics_events.pending_lookups(), 0)
+        queued = already_running = seen = 0
+        for song in queryset.only('id', 'title', 'artist').iterator(chunk_size=500):
+            if queued >= room:
+                break
+            seen += 1
+            ticket = lyrics_events.make_ticket(song.artist, song.title, song.id)
+            if lyrics_events.lookup_in_progress(ticket):
+                already_running += 1
+                continue
+            lyrics_events.request_lookup(song.artist, song.title, song.id)
+            queued += 1
 
-# Register your models here.
-admin.site.register(Song)
\ No newline at end of file
+        message = f'Queued lyrics lookups for {queued} songs'
+        if already_running:
+            message += f' ({already_running} already in progress)'
+        skipped = queryset.count() - seen if queued >= room else 0
+        if skipped:
+            self.message_user(request, f'{message}. Skipped {skipped} songs: no more than {room} lookups '
+                                       f'could be queued - run the action again once these are done.',
+                              messages.WARNING)
+        else:
+            self.message_user(request, message, messages.SUCCESS)
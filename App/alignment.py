@@ -0,0 +1,196 @@
+# alignment.py - Place plain-text lyric lines on the real audio timeline
+#
+# Plain lyrics have no timestamps, so instead of a fixed 3 seconds per line the
+# lines are spread over the parts of the track where someone is singing:
+#   1. decode the audio to mono PCM at a low sample rate
+#   2. frame it and compute energy, voice-band ratio and spectral flux (all NumPy, no Python loops)
+#   3. mark frames with vocal activity and pick onsets from the flux
+#   4. hand out the vocal time to the lines by their length and snap each start to an onset
+import json
+import subprocess
+import wave
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SAMPLE_RATE = 8000       # Voice lives below 4 kHz, plenty for timing
+FRAME_LENGTH = 512       # 64 ms frames
+HOP_LENGTH = 256         # 32 ms between frames
+VOICE_BAND = (250, 3500) # Hz
+SNAP_WINDOW = 0.75       # Max seconds a line start may move to reach an onset
+PHRASE_WINDOW = 3.0      # Max seconds a line start may move to reach the start of a sung phrase
+
+
+def decode_audio(path, sample_rate=SAMPLE_RATE):
+    """Decode an audio file to a float32 mono array (ffmpeg for compressed formats)"""
+    if path.lower().endswith('.wav'):
+        with wave.open(path, 'rb') as w:
+            if w.getsampwidth() != 2:
+                raise ValueError("Only 16-bit WAV files are supported")
+            channels, rate = w.getnchannels(), w.getframerate()
+            samples = np.frombuffer(w.readframes(w.getnframes()), dtype='<i2').astype(np.float32) / 32768
+        samples = samples.reshape(-1, channels).mean(axis=1)
+        if rate != sample_rate:
+            # Linear resampling is good enough for energy/onset features
+            positions = np.arange(0, len(samples), rate / sample_rate)
+            samples = np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+        return samples
+
+    command = [
+        'ffmpeg', '-v', 'error', '-i', path,
+        '-ac', '1', '-ar', str(sample_rate), '-f', 's16le', '-',
+    ]
+    result = subprocess.run(command, capture_output=True, check=True)
+    return np.frombuffer(result.stdout, dtype='<i2').astype(np.float32) / 32768
+
+
+def frame_features(samples, sample_rate=SAMPLE_RATE):
+    """Per-frame RMS energy, voice-band energy ratio and positive spectral flux"""
+    if len(samples) < FRAME_LENGTH:
+        samples = np.pad(samples, (0, FRAME_LENGTH - len(samples)))
+
+    frames = np.lib.stride_tricks.sliding_window_view(samples, FRAME_LENGTH)[::HOP_LENGTH]
+    rms = np.sqrt(np.mean(frames ** 2, axis=1))
+
+    spectrum = np.abs(np.fft.rfft(frames * np.hanning(FRAME_LENGTH), axis=1))
+    freqs = np.fft.rfftfreq(FRAME_LENGTH, 1 / sample_rate)
+    band = (freqs >= VOICE_BAND[0]) & (freqs <= VOICE_BAND[1])
+    power = spectrum ** 2
+    voice_ratio = power[:, band].sum(axis=1) / (power.sum(axis=1) + 1e-10)
+
+    log_spectrum = np.log1p(spectrum)
+    flux = np.concatenate([[0.0], np.maximum(np.diff(log_spectrum, axis=0), 0).sum(axis=1)])
+    return rms, voice_ratio, flux
+
+
+def vocal_activity(rms, voice_ratio, smoothing=15):
+    """Boolean mask of frames that are loud enough and dominated by the voice band"""
+    # Threshold sits a quarter of the way from the noise floor to the loud parts
+    floor, peak = np.percentile(rms, [10, 90])
+    loud = rms > max(floor + 0.25 * (peak - floor), 1e-4)
+    voiced = voice_ratio > np.median(voice_ratio) * 0.8
+    active = (loud & voiced).astype(np.float32)
+    # Bridge short gaps between words (~0.5 s)
+    kernel = np.ones(smoothing, dtype=np.float32) / smoothing
+    return np.convolve(active, kernel, mode='same') > 0.3
+
+
+def detect_onsets(flux):
+    """Frame indices of local flux peaks that stand out from the track's average"""
+    if len(flux) < 3:
+        return np.array([], dtype=int)
+    threshold = flux.mean() + flux.std()
+    middle = flux[1:-1]
+    peaks = (middle > flux[:-2]) & (middle >= flux[2:]) & (middle > threshold)
+    return np.nonzero(peaks)[0] + 1
+
+
+def snap_to_nearest(values, anchors, window):
+    """Move each value to its closest anchor when that is at most window away"""
+    if not len(anchors):
+        return values
+    right = np.clip(np.searchsorted(anchors, values), 0, len(anchors) - 1)
+    left = np.maximum(right - 1, 0)
+    closer_left = np.abs(values - anchors[left]) <= np.abs(anchors[right] - values)
+    nearest = np.where(closer_left, anchors[left], anchors[right])
+    return np.where(np.abs(nearest - values) <= window, nearest, values)
+
+
+def align_lines(lines, samples, sample_rate=SAMPLE_RATE):
+    """Return a start time in seconds for every lyric line"""
+    rms, voice_ratio, flux = frame_features(samples, sample_rate)
+    frame_seconds = HOP_LENGTH / sample_rate
+    times = np.arange(len(rms)) * frame_seconds
+
+    active = vocal_activity(rms, voice_ratio)
+    if not active.any():
+        active[:] = True
+
+    # Cumulative vocal time per frame: lines are spread over singing only
+    vocal_time = np.cumsum(active) * frame_seconds
+    weights = np.array([max(len(line), 1) for line in lines], dtype=np.float64)
+    shares = vocal_time[-1] * weights / weights.sum()
+    targets = np.concatenate([[0.0], np.cumsum(shares)[:-1]])
+
+    def to_time(vocal_seconds):
+        index = np.searchsorted(vocal_time, vocal_seconds, side='right')
+        return times[np.minimum(index, len(times) - 1)]
+
+    starts = to_time(targets)
+    middles = to_time(targets + shares / 2)
+
+    # A line belongs to the phrase that holds its middle. When it is the first
+    # line of that phrase and the phrase starts close to (or after) the computed
+    # start, the line starts with the phrase - this stops lines from beginning
+    # in the last frames of the previous phrase. A line never skips more than
+    # PHRASE_WINDOW seconds of singing to get there.
+    phrase_frames = np.nonzero(np.diff(active.astype(np.int8)) == 1)[0] + 1
+    if len(phrase_frames):
+        index = np.searchsorted(times[phrase_frames], middles, side='right') - 1
+        frame = phrase_frames[np.maximum(index, 0)]
+        phrase = times[frame]
+        skipped = vocal_time[frame - 1] - targets
+        previous_middles = np.concatenate([[-np.inf], middles[:-1]])
+        use_phrase = ((index >= 0) & (phrase >= starts - PHRASE_WINDOW)
+                      & (skipped <= PHRASE_WINDOW) & (phrase > previous_middles))
+        starts = np.where(use_phrase, phrase, starts)
+
+    # Fine-tune on the nearest onset
+    starts = snap_to_nearest(starts, times[detect_onsets(flux)], SNAP_WINDOW)
+
+    # Snapping must never reorder lines
+    return np.maximum.accumulate(starts)
+
+
+def align_lyrics_text(text, samples, sample_rate=SAMPLE_RATE):
+    """Timed lyrics (same JSON shape as fetched LRC lyrics) for plain text"""
+    lines = [line.strip() for line in text.strip().split('\n') if line.strip()]
+    if not lines:
+        return []
+
+    starts = align_lines(lines, samples, sample_rate)
+    return [
+        {
+            "time": f"{int(start) // 60}:{int(start) % 60:02d}",
+            "timestamp": round(float(start), 2),
+            "lyrics": line,
+        }
+        for line, start in zip(lines, starts)
+    ]
+
+
+def align_song_lyrics(song_id):
+    """Background job: time a song's plain-text lyrics against its audio file and store them"""
+    from .models import Song
+
+    if np is None:
+        print("numpy not installed. Install with: pip install numpy")
+        return None
+
+    song = Song.objects.get(id=song_id)
+    if not song.has_plain_text_lyrics() or not song.audio_file:
+        return None
+
+    try:
+        samples = decode_audio(song.audio_file.path)
+    except (OSError, ValueError, subprocess.CalledProcessError) as e:
+        print(f"Could not decode audio for song {song_id}: {e}")
+        return None
+
+    aligned = align_lyrics_text(song.lyrics, samples)
+    if not aligned:
+        return None
+
+    # Only store if nobody replaced the lyrics while we were working
+    updated = Song.objects.filter(id=song_id, lyrics=song.lyrics).update(
+        lyrics=json.dumps(aligned, ensure_ascii=False)
+    )
+    if updated:
+        from .caching import forget_song_pages
+        from .lyrics_events import publish
+        print(f"Aligned {len(aligned)} lyric lines for song ID: {song_id}")
+        forget_song_pages(song_id)
+        publish('ready', song_id=song_id, lyrics=aligned, message=f'Aligned {len(aligned)} lyric lines')
+    return aligned if updated else None
@@ -0,0 +1,169 @@
+# caching.py - Shared caches for normalized lyrics, rendered index pages and media metadata
+#
+# Everything lives in the settings.WARM_CACHE alias, which all worker processes
+# share and `manage.py warm_caches` fills ahead of traffic. Requests only read it:
+# what they compute on a miss is kept in process memory (settings.LOCAL_CACHE)
+# when it can never go stale, and not at all otherwise, so page views never
+# write to the shared store. Keys carry what the value depends on, so nothing
+# stale is ever served:
+#   lyrics:<song id>:<hash of the lyrics>   the text changes -> a new key
+#   index:<generation>:<build>:<page>       a changed song drops its page and the one
+#                                           before; adding or removing the last song only
+#                                           those around the end; the generation moves
+#                                           when songs are inserted or removed mid-list
+#   media:<name>                            content-addressed names only, their bytes
+#                                           never change
+import hashlib
+import mimetypes
+import os
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+
+# Media metadata is also kept in process memory, a stat of the cache is not free either
+_local_media = {}
+LOCAL_MEDIA_LIMIT = 10000
+
+
+def cache():
+    return caches[getattr(settings, 'WARM_CACHE', 'default')]
+
+
+def local_cache():
+    return caches[getattr(settings, 'LOCAL_CACHE', 'default')]
+
+
+def get_immutable(key):
+    """Value of a key whose value never changes: process memory first, then the shared cache"""
+    value = local_cache().get(key)
+    if value is None:
+        value = cache().get(key)
+        if value is not None:
+            local_cache().set(key, value, None)
+    return value
+
+
+# ----- Lyrics -----
+
+def lyrics_key(song):
+    digest = hashlib.sha1(song.lyrics.encode('utf-8')).hexdigest()[:16]
+    return f'lyrics:{song.pk}:{digest}'
+
+
+def formatted_lyrics(song):
+    """Song.convert_lyrics_to_json(), computed once per version of the lyrics"""
+    if song.pk is None:
+        return song.convert_lyrics_to_json()
+    key = lyrics_key(song)
+    value = get_immutable(key)
+    if value is None:
+        value = song.convert_lyrics_to_json()
+        local_cache().set(key, value, None)
+    return value
+
+
+# ----- Rendered index pages -----
+
+@lru_cache(maxsize=None)
+def build_id():
+    """Changes with every collectstatic, so pages never point at old asset names"""
+    try:
+        return str(os.stat(os.path.join(settings.STATIC_ROOT, 'staticfiles.json')).st_mtime_ns)
+    except (OSError, TypeError):
+        return 'dev'
+
+
+def page_generation():
+    return cache().get('index:generation') or 1
+
+
+def index_page_key(page_number, generation=None):
+    return f'index:{generation or page_generation()}:{build_id()}:{int(page_number)}'
+
+
+def get_index_page(page_number):
+    """(html, link header) for a page stored by warm_caches, or None"""
+    return cache().get(index_page_key(page_number))
+
+
+def forget_index_pages():
+    """Songs were inserted or removed mid-list: every later page now shows another song"""
+    try:
+        cache().incr('index:generation')
+    except ValueError:
+        cache().set('index:generation', 2, None)
+
+
+def forget_song_pages(song_id):
+    """A song changed: drop its page and the one before it (which links to it as the next track)"""
+    from .models import Song
+
+    page_number = Song.objects.filter(id__lt=song_id).count() + 1
+    generation = page_generation()
+    cache().delete_many([index_page_key(n, generation) for n in (page_number - 1, page_number) if n > 0])
+
+
+def forget_pages_around(song_id):
+    """
+    A song was added or removed (call after the insert or delete).
+
+    Pages are in id order, so when no song comes after it - the usual case,
+    ids only grow - only its own page and the one before it (whose next
+    track it is, or was) change; the rest of the warmed pages stay valid.
+    Anywhere else every later page shifts by one.
+    """
+    from .models import Song
+
+    if Song.objects.filter(id__gt=song_id).exists():
+        forget_index_pages()
+    else:
+        forget_song_pages(song_id)
+
+
+# ----- Media metadata -----
+
+def is_immutable(name):
+    is_content_addressed = getattr(default_storage, 'is_content_addressed', None)
+    return bool(is_content_addressed and is_content_addressed(name))
+
+
+def stat_media(name, path):
+    """Size, mtime, ETag and content type of a media file (raises OSError when it is missing)"""
+    stat = os.stat(path)
+    if is_immutable(name):
+        # The name is the SHA-256 of the content: the same ETag on every server
+        etag = f'"{os.path.splitext(os.path.basename(name))[0]}"'
+    else:
+        etag = f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+    content_type, _ = mimetypes.guess_type(path)
+    return {
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'etag': etag,
+        'content_type': content_type or 'application/octet-stream',
+    }
+
+
+def media_key(name):
+    return f'media:{name}'
+
+
+def media_metadata(name, path):
+    """stat_media() without touching the disk for files whose content cannot change"""
+    if not is_immutable(name):
+        return stat_media(name, path)
+
+    metadata = _local_media.get(name) or cache().get(media_key(name))
+    if metadata is None:
+        metadata = stat_media(name, path)
+    if len(_local_media) >= LOCAL_MEDIA_LIMIT:
+        _local_media.clear()
+    _local_media[name] = metadata
+    return metadata
+
+
+def forget_media(name):
+    _local_media.pop(name, None)
+    cache().delete(media_key(name))
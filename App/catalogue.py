@@ -0,0 +1,278 @@
+# catalogue.py - Streaming export/import of songs and lyrics (NDJSON and LRC archives)
+#
+# Everything here works on iterators: exports read the table with
+# .iterator(chunk_size=...) and yield output as they go, imports consume their
+# input in fixed-size batches. Memory use does not grow with the library.
+import io
+import json
+import math
+import re
+import tarfile
+import time
+from collections import Counter
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from . import caching
+from .models import MAX_SONG_ID, Song
+from .signals import MEDIA_FIELDS
+
+EXPORT_FIELDS = ('id', 'title', 'artist', 'duration', 'image', 'audio_file', 'audio_link', 'lyrics')
+IMPORT_FIELDS = ('title', 'artist', 'duration', 'image', 'audio_file', 'audio_link', 'lyrics')
+NULLABLE_FIELDS = ('audio_link', 'lyrics')
+LRC_NAME_PATTERN = re.compile(r'(?:^|/)(\d+)[^/]*\.lrc$')
+
+
+def export_queryset(chunk_size=2000):
+    return Song.objects.order_by('id').only(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+
+
+def song_to_record(song):
+    return {
+        'id': song.id,
+        'title': song.title,
+        'artist': song.artist,
+        'duration': song.duration,
+        'image': song.image.name or '',
+        'audio_file': song.audio_file.name or '',
+        'audio_link': song.audio_link,
+        'lyrics': song.lyrics,
+    }
+
+
+def iter_ndjson(chunk_size=2000):
+    """One JSON object per song per line (media is referenced by name, not embedded)"""
+    for song in export_queryset(chunk_size):
+        yield json.dumps(song_to_record(song), ensure_ascii=False) + '\n'
+
+
+def song_to_lrc(song):
+    """LRC text for a song's lyrics, or None when it has none"""
+    try:
+        lines = json.loads(song.get_formatted_lyrics())
+    except json.JSONDecodeError:
+        return None
+    if not lines:
+        return None
+
+    output = [f'[ar:{song.artist}]', f'[ti:{song.title}]']
+    bad_lines = 0
+    for line in lines:
+        seconds = line_seconds(line)
+        if seconds is None:
+            # One bad line must not abort an archive that is already streaming
+            bad_lines += 1
+            continue
+        output.append(f"[{int(seconds) // 60:02d}:{seconds % 60:05.2f}]{line.get('lyrics', '')}")
+    if bad_lines:
+        print(f"Skipped {bad_lines} lyric line(s) without a valid time in song ID: {song.id}")
+    return '\n'.join(output) + '\n' if len(output) > 2 else None
+
+
+def line_seconds(line):
+    """Start of a lyrics JSON line in seconds, or None when its time is malformed"""
+    try:
+        seconds = line.get('timestamp')
+        if seconds is None:
+            minutes, secs = (line.get('time') or '0:00').split(':')[:2]
+            seconds = int(minutes) * 60 + float(secs)
+        seconds = float(seconds)
+    except (AttributeError, TypeError, ValueError):
+        return None
+    return seconds if math.isfinite(seconds) and seconds >= 0 else None
+
+
+def lrc_filename(song):
+    safe = re.sub(r'[^\w\s-]', '', f'{song.artist} - {song.title}').strip().replace(' ', '_')[:80]
+    return f'{song.id:06d}_{safe}.lrc'
+
+
+class _ChunkWriter(io.RawIOBase):
+    """File object for tarfile that hands written bytes back to the generator"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_lrc_archive(chunk_size=2000):
+    """A .tar.gz with one <id>_<artist>_-_<title>.lrc per song that has lyrics, streamed"""
+    writer = _ChunkWriter()
+    now = time.time()
+    with tarfile.open(fileobj=writer, mode='w|gz') as archive:
+        for song in export_queryset(chunk_size):
+            lrc = song_to_lrc(song)
+            if not lrc:
+                continue
+            data = lrc.encode('utf-8')
+            info = tarfile.TarInfo(lrc_filename(song))
+            info.size = len(data)
+            info.mtime = now
+            archive.addfile(info, io.BytesIO(data))
+            chunk = writer.drain()
+            if chunk:
+                yield chunk
+    yield writer.drain()
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def apply_batch(records, fields, create=True):
+    """Update the songs that exist and create the rest - two bulk queries per batch"""
+    # The last record wins when an id repeats within the batch
+    with_id = {r['id']: r for r in records if r.get('id') is not None}
+    records = list(with_id.values()) + [r for r in records if r.get('id') is None]
+    existing = Song.objects.only('id', *fields).in_bulk(list(with_id))
+
+    to_update, to_create = [], []
+    # Net change in the number of songs using each stored media name
+    media_references = Counter()
+    for record in records:
+        song = existing.get(record.get('id'))
+        is_new = song is None
+        if is_new:
+            if not create:
+                continue
+            song = Song(id=record.get('id'))
+
+        changed = False
+        for field in fields:
+            if field in record:
+                value = record[field]
+                if value is None and field not in NULLABLE_FIELDS:
+                    value = ''
+                current = getattr(song, field)
+                current_value = current.name if hasattr(current, 'name') else current
+                if current_value != value:
+                    setattr(song, field, value)
+                    changed = True
+                    if field in MEDIA_FIELDS:
+                        if value:
+                            media_references[value] += 1
+                        if current_value and not is_new:
+                            media_references[current_value] -= 1
+
+        if is_new:
+            to_create.append(song)
+        elif changed:
+            # Unchanged rows (e.g. re-importing an export) cost no write at all
+            to_update.append(song)
+
+    # Bulk operations skip save() signals: no alignment jobs on import, and the
+    # media references the signals would count are counted here instead
+    with transaction.atomic():
+        if to_create:
+            Song.objects.bulk_create(to_create, batch_size=500)
+        if to_update:
+            Song.objects.bulk_update(to_update, fields, batch_size=500)
+        update_media_references(media_references)
+    if to_create or to_update:
+        caching.forget_index_pages()
+    return len(to_create), len(to_update)
+
+
+def update_media_references(changes):
+    """Apply net reference changes per media name; files are released once the import commits"""
+    for name, change in changes.items():
+        if not change or not default_storage.is_content_addressed(name):
+            continue  # Names outside the content-addressed layout are not counted
+        if change > 0:
+            default_storage.add_references(name, change)
+        else:
+            for _ in range(-change):
+                transaction.on_commit(lambda name=name: default_storage.delete(name))
+
+
+def song_id(value):
+    """Integer id from an imported record, or None when it is not a valid one"""
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        return None
+    try:
+        number = int(value)
+    except (TypeError, ValueError, OverflowError):
+        return None
+    return number if 1 <= number <= MAX_SONG_ID else None
+
+
+def import_ndjson(lines, batch_size=1000):
+    """Import NDJSON lines (as produced by iter_ndjson); returns (created, updated, skipped)"""
+    created = updated = skipped = 0
+
+    def records():
+        nonlocal skipped
+        for line in lines:
+            if isinstance(line, bytes):
+                line = line.decode('utf-8')
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                skipped += 1
+                continue
+            if not isinstance(record, dict) or not record.get('title'):
+                skipped += 1
+                continue
+            if record.get('id') is not None:
+                # "5" must update song 5, not miss it and collide on insert
+                record['id'] = song_id(record['id'])
+                if record['id'] is None:
+                    skipped += 1
+                    continue
+            yield record
+
+    for batch in batched(records(), batch_size):
+        c, u = apply_batch(batch, IMPORT_FIELDS)
+        created += c
+        updated += u
+    return created, updated, skipped
+
+
+def import_lrc_archive(fileobj, batch_size=1000):
+    """Set lyrics from an archive made by iter_lrc_archive; returns (updated, skipped)"""
+    from .views import convert_lrc_to_json
+
+    updated = skipped = 0
+
+    def records():
+        nonlocal skipped
+        with tarfile.open(fileobj=fileobj, mode='r|*') as archive:
+            for member in archive:
+                match = LRC_NAME_PATTERN.search(member.name)
+                if not member.isfile() or not match:
+                    skipped += 1
+                    continue
+                lyrics = convert_lrc_to_json(archive.extractfile(member).read().decode('utf-8', 'replace'))
+                if not lyrics:
+                    skipped += 1
+                    continue
+                yield {'id': int(match.group(1)), 'lyrics': json.dumps(lyrics, ensure_ascii=False)}
+
+    for batch in batched(records(), batch_size):
+        # Lyrics only attach to songs that already exist
+        _, u = apply_batch(batch, ('lyrics',), create=False)
+        updated += u
+        skipped += len(batch) - u
+    return updated, skipped
@@ -0,0 +1,24 @@
+# checks.py - System checks for deployment prerequisites
+from django.core.checks import Error, Tags, Warning, register
+
+from .templatetags.assets import missing_vendor_assets
+
+VENDOR_HINT = "Run 'python manage.py vendor_assets' and commit App/static/vendor/."
+
+
+@register(Tags.staticfiles)
+def check_vendor_assets(app_configs, **kwargs):
+    """Libraries from settings.VENDOR_ASSETS without a local copy"""
+    missing = missing_vendor_assets()
+    if not missing:
+        return []
+    return [Warning(f"Front-end libraries not vendored: {', '.join(missing)}", hint=VENDOR_HINT, id='App.W001')]
+
+
+@register(Tags.staticfiles, deploy=True)
+def check_vendor_assets_deploy(app_configs, **kwargs):
+    """With DEBUG off a missing library breaks the page: fail `check --deploy`"""
+    missing = missing_vendor_assets()
+    if not missing:
+        return []
+    return [Error(f"Front-end libraries not vendored: {', '.join(missing)}", hint=VENDOR_HINT, id='App.E001')]
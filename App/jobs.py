@@ -0,0 +1,73 @@
+# jobs.py - Small in-process background job runner
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+
+_executors = {}
+_pending = {}
+_lock = threading.RLock()
+
+
+def _executor_for(key):
+    """
+    Pool a job runs on: the key's prefix ("lookup" for "lookup:...") when
+    settings.BACKGROUND_JOB_POOLS gives it its own threads, else the shared one.
+    """
+    pools = getattr(settings, 'BACKGROUND_JOB_POOLS', {})
+    prefix = key.split(':', 1)[0]
+    name = prefix if prefix in pools else 'default'
+    executor = _executors.get(name)
+    if executor is None:
+        workers = pools[name] if name in pools else getattr(settings, 'BACKGROUND_JOB_WORKERS', 2)
+        executor = _executors[name] = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='melophile-job' if name == 'default' else f'melophile-{name}',
+        )
+    return executor
+
+
+def submit(key, fn, *args, **kwargs):
+    """
+    Run fn(*args, **kwargs) on the worker pool and return its Future.
+
+    Jobs are identified by key: while one is queued or running, submitting the
+    same key returns the existing Future instead of doing the work twice.
+    """
+    with _lock:
+        future = _pending.get(key)
+        if future is not None and not future.done():
+            return future
+        future = _executor_for(key).submit(_run, key, fn, args, kwargs)
+        _pending[key] = future
+        future.add_done_callback(lambda f: _forget(key, f))
+        return future
+
+
+def is_pending(key):
+    with _lock:
+        future = _pending.get(key)
+        return future is not None and not future.done()
+
+
+def pending_count(prefix=''):
+    """Number of queued or running jobs whose key starts with prefix"""
+    with _lock:
+        return sum(1 for key, future in _pending.items() if key.startswith(prefix) and not future.done())
+
+
+def _run(key, fn, args, kwargs):
+    try:
+        return fn(*args, **kwargs)
+    except Exception as e:
+        print(f"Background job {key} failed: {e}")
+        raise
+    finally:
+        # Worker threads keep their own DB connections - do not leak them
+        connections.close_all()
+
+
+def _forget(key, future):
+    with _lock:
+        if _pending.get(key) is future:
+            del _pending[key]
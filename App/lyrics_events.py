@@ -0,0 +1,179 @@
+# lyrics_events.py - Background lyric lookups and "lyrics ready" notifications over SSE
+#
+# fetch_lyrics hands the lookup to the job pool and answers at once with a
+# ticket. Whatever stores lyrics (that job, update_song_lyrics, bulk updates,
+# the aligner) calls publish(), which writes a LyricsEvent row and wakes the
+# open event streams. Streams in this process wake up immediately; streams in
+# other worker processes see the row on their next one-second check.
+import hashlib
+import json
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from . import jobs
+from .models import LyricsEvent, Song
+from .ratelimit import lookup_slot, TooManyLookups
+
+_condition = threading.Condition()
+_published = 0
+
+# How long events are kept for clients reconnecting with Last-Event-ID
+EVENT_RETENTION = timedelta(hours=1)
+# A stream is closed after this long; EventSource reconnects by itself
+STREAM_MAX_SECONDS = 55
+HEARTBEAT_SECONDS = 15
+POLL_SECONDS = 1
+# Tries for a provider slot (see ratelimit.lookup_slot) before a queued lookup gives up
+LOOKUP_SLOT_ATTEMPTS = 5
+
+
+def make_ticket(artist, title, song_id=None):
+    """Same song, same ticket: repeated clicks and other tabs share one lookup"""
+    key = f"{song_id or ''}|{artist.strip().lower()}|{title.strip().lower()}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+
+def latest_event_id():
+    return LyricsEvent.objects.aggregate(latest=Max('id'))['latest'] or 0
+
+
+def publish(status, song_id=None, ticket='', lyrics=None, message=''):
+    """Record a lookup outcome and wake every stream waiting in this process"""
+    global _published
+    event = LyricsEvent.objects.create(
+        song_id=song_id,
+        ticket=ticket,
+        status=status,
+        payload=json.dumps(lyrics, ensure_ascii=False) if lyrics is not None else '',
+        message=message[:200],
+    )
+    with _condition:
+        _published += 1
+        prune = _published % 100 == 0
+        _condition.notify_all()
+
+    if prune:
+        LyricsEvent.objects.filter(created_at__lt=timezone.now() - EVENT_RETENTION).delete()
+    return event
+
+
+def store_lyrics(song, lyrics_data, ticket=''):
+    """Save fetched lyrics on a song and notify its listeners"""
+    song.lyrics = json.dumps(lyrics_data, ensure_ascii=False)
+    song.save(update_fields=['lyrics'])
+    publish('ready', song_id=song.id, ticket=ticket, lyrics=lyrics_data,
+            message=f'Found {len(lyrics_data)} synced lyric lines')
+
+
+def request_lookup(artist, title, song_id=None):
+    """Queue a lookup (or join the one already running); returns the ticket"""
+    ticket = make_ticket(artist, title, song_id)
+    jobs.submit(f'lookup:{ticket}', run_lookup, ticket, artist, title, song_id)
+    return ticket
+
+
+def lookup_in_progress(ticket):
+    return jobs.is_pending(f'lookup:{ticket}')
+
+
+def pending_lookups():
+    return jobs.pending_count('lookup:')
+
+
+def run_lookup(ticket, artist, title, song_id=None):
+    """Background job behind fetch_lyrics: always ends with an event for the ticket"""
+    try:
+        lookup_and_store(ticket, artist, title, song_id)
+    except Exception as e:
+        # The page waiting on this ticket would otherwise spin forever
+        publish('error', ticket=ticket, message=f'Error fetching lyrics: {e}')
+        raise
+
+
+def lookup_and_store(ticket, artist, title, song_id=None):
+    from .views import get_synced_lyrics
+
+    # Wait a little for a free provider slot, but give up rather than hold the thread
+    for attempt in range(LOOKUP_SLOT_ATTEMPTS):
+        try:
+            with lookup_slot():
+                lyrics_data = get_synced_lyrics(artist, title)
+            break
+        except TooManyLookups as e:
+            if attempt + 1 < LOOKUP_SLOT_ATTEMPTS:
+                time.sleep(e.retry_after)
+    else:
+        publish('error', ticket=ticket, message='Lyrics service is busy, please try again shortly')
+        return
+
+    if not lyrics_data:
+        publish('not_found', song_id=song_id, ticket=ticket,
+                message='No synced lyrics found for this song. Try checking the spelling or try a different song.')
+        return
+
+    if song_id:
+        try:
+            store_lyrics(Song.objects.get(id=song_id), lyrics_data, ticket)
+            print(f"Lyrics saved to database for song ID: {song_id}")
+            return
+        except Song.DoesNotExist:
+            print(f"Song with ID {song_id} not found")
+
+    publish('ready', song_id=None, ticket=ticket, lyrics=lyrics_data,
+            message=f'Found {len(lyrics_data)} synced lyric lines')
+
+
+def format_event(event):
+    data = {
+        'status': event.status,
+        'song_id': event.song_id,
+        'ticket': event.ticket,
+        'message': event.message,
+        'lyrics': json.loads(event.payload) if event.payload else None,
+    }
+    return f"id: {event.id}\nevent: lyrics\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def event_stream(song_ids, tickets, last_id):
+    """
+    SSE body: events for the given songs/tickets newer than last_id, for up to STREAM_MAX_SECONDS.
+
+    The stream ends as soon as every song has had a 'ready' event and every
+    ticket an event of any kind, so the worker thread it holds is given back
+    once there is nothing left to wait for.
+    """
+    filters = Q(song_id__in=song_ids) | Q(ticket__in=tickets)
+    waiting_for_songs = set(song_ids)
+    waiting_for_tickets = set(tickets)
+    deadline = time.monotonic() + getattr(settings, 'LYRICS_STREAM_MAX_SECONDS', STREAM_MAX_SECONDS)
+    next_heartbeat = time.monotonic() + HEARTBEAT_SECONDS
+
+    yield "retry: 1000\n\n"
+    while time.monotonic() < deadline:
+        with _condition:
+            seen = _published
+
+        events = list(LyricsEvent.objects.filter(filters, id__gt=last_id).order_by('id')[:50])
+        for event in events:
+            last_id = event.id
+            yield format_event(event)
+            waiting_for_tickets.discard(event.ticket)
+            if event.status == 'ready':
+                waiting_for_songs.discard(event.song_id)
+        if not waiting_for_songs and not waiting_for_tickets:
+            return
+        if events:
+            continue
+
+        if time.monotonic() >= next_heartbeat:
+            next_heartbeat = time.monotonic() + HEARTBEAT_SECONDS
+            yield ": keep-alive\n\n"
+
+        with _condition:
+            if _published == seen:
+                _condition.wait(POLL_SECONDS)
@@ -0,0 +1,38 @@
+# align_lyrics.py - Time plain-text lyrics against the audio for the whole library
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from App import alignment
+from App.models import Song
+
+
+class Command(BaseCommand):
+    help = "Replace fixed 3-second spacing of plain-text lyrics with audio-aligned timestamps"
+
+    def add_arguments(self, parser):
+        parser.add_argument('song_ids', nargs='*', type=int, help='Only these songs (default: all)')
+
+    def handle(self, *args, **options):
+        if alignment.np is None:
+            raise CommandError("numpy not installed. Install with: pip install numpy")
+
+        songs = Song.objects.exclude(lyrics__isnull=True).exclude(lyrics='').exclude(audio_file='')
+        if options['song_ids']:
+            songs = songs.filter(id__in=options['song_ids'])
+
+        aligned = skipped = 0
+        for song in songs.only('id', 'title', 'lyrics', 'audio_file').iterator(chunk_size=200):
+            if not song.has_plain_text_lyrics():
+                skipped += 1
+                continue
+
+            started = time.perf_counter()
+            result = alignment.align_song_lyrics(song.id)
+            if result:
+                aligned += 1
+                self.stdout.write(f"{song.title}: {len(result)} lines in {time.perf_counter() - started:.2f}s")
+            else:
+                skipped += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Aligned {aligned} songs, skipped {skipped}"))
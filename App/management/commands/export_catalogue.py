@@ -0,0 +1,35 @@
+# export_catalogue.py - Stream the song catalogue to NDJSON or an LRC archive
+import sys
+
+from django.core.management.base import BaseCommand
+
+from App import catalogue
+
+
+class Command(BaseCommand):
+    help = "Export songs and lyrics as NDJSON (one song per line) or a .tar.gz of LRC files"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=['ndjson', 'lrc'], default='ndjson')
+        parser.add_argument('--output', '-o', default='-', help='File to write (default: stdout)')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched per database round trip')
+
+    def handle(self, *args, **options):
+        if options['format'] == 'ndjson':
+            chunks = (line.encode('utf-8') for line in catalogue.iter_ndjson(options['chunk_size']))
+        else:
+            chunks = catalogue.iter_lrc_archive(options['chunk_size'])
+
+        to_stdout = options['output'] == '-'
+        output = sys.stdout.buffer if to_stdout else open(options['output'], 'wb')
+        written = 0
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+                written += len(chunk)
+        finally:
+            if not to_stdout:
+                output.close()
+
+        if not to_stdout:
+            self.stdout.write(self.style.SUCCESS(f"Wrote {written} bytes to {options['output']}"))
@@ -0,0 +1,40 @@
+# import_catalogue.py - Load an NDJSON catalogue or LRC archive in constant memory
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from App import catalogue
+
+
+class Command(BaseCommand):
+    help = "Import songs from NDJSON (created or updated by id) or lyrics from an LRC .tar(.gz) archive"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File made by export_catalogue ('-' for stdin)")
+        parser.add_argument('--format', choices=['auto', 'ndjson', 'lrc'], default='auto')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Songs written per bulk query')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format']
+        if file_format == 'auto':
+            file_format = 'lrc' if path.endswith(('.tar', '.tar.gz', '.tgz')) else 'ndjson'
+
+        source = sys.stdin.buffer if path == '-' else None
+        try:
+            source = source or open(path, 'rb')
+        except OSError as e:
+            raise CommandError(f"Cannot open {path}: {e}")
+
+        try:
+            if file_format == 'ndjson':
+                created, updated, skipped = catalogue.import_ndjson(source, options['batch_size'])
+                summary = f"Created {created}, updated {updated}, skipped {skipped} lines"
+            else:
+                updated, skipped = catalogue.import_lrc_archive(source, options['batch_size'])
+                summary = f"Updated lyrics for {updated} songs, skipped {skipped} entries"
+        finally:
+            if source is not sys.stdin.buffer:
+                source.close()
+
+        self.stdout.write(self.style.SUCCESS(summary))
@@ -0,0 +1,21 @@
+# profile_token.py - Print a signed token that turns on profiling for requests carrying it
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from App import profiling
+
+
+class Command(BaseCommand):
+    help = "Print a token for the X-Profile header or ?profile= parameter (needs PROFILING_ENABLED)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=profiling.MODES, default='cprofile',
+                            help='cprofile writes a .prof (pstats) file, sample writes collapsed stacks')
+
+    def handle(self, *args, **options):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            self.stderr.write(self.style.WARNING("PROFILING_ENABLED is off - the token has no effect until it is set"))
+        token = profiling.make_token(options['mode'])
+        max_age = getattr(settings, 'PROFILING_TOKEN_MAX_AGE', 3600)
+        self.stdout.write(token)
+        self.stderr.write(f"Valid for {max_age // 60} minutes, e.g. curl -H 'X-Profile: {token}' ...")
@@ -0,0 +1,56 @@
+# rehash_media.py - Move media stored before content addressing into the sharded layout
+from django.core.management.base import BaseCommand
+
+from App import caching
+from App.models import Song
+from App.signals import MEDIA_FIELDS
+
+
+class Command(BaseCommand):
+    help = "Re-store flat MEDIA_ROOT files under content-addressed names, merging duplicates"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would move')
+
+    def handle(self, *args, **options):
+        moved = duplicates = missing = 0
+        seen = {}
+
+        for song in Song.objects.only('id', *MEDIA_FIELDS).iterator(chunk_size=500):
+            changes = {}
+            for field_name in MEDIA_FIELDS:
+                field_file = getattr(song, field_name)
+                storage = field_file.storage
+                if not field_file or storage.is_content_addressed(field_file.name):
+                    continue
+                if not storage.exists(field_file.name):
+                    missing += 1
+                    self.stderr.write(f"Song {song.id}: {field_file.name} not found")
+                    continue
+
+                old_name = field_file.name
+                if options['dry_run']:
+                    self.stdout.write(f"Song {song.id}: would re-store {old_name}")
+                    continue
+
+                with storage.open(old_name) as f:
+                    new_name = storage.save(old_name, f)
+                changes[field_name] = new_name
+                if new_name in seen:
+                    duplicates += 1
+                seen[new_name] = old_name
+                moved += 1
+                self.stdout.write(f"Song {song.id}: {old_name} -> {new_name}")
+
+            if changes:
+                # queryset.update skips the save signals - the new names are already counted
+                Song.objects.filter(pk=song.pk).update(**changes)
+
+        if moved:
+            # Pages embed the media URLs
+            caching.forget_index_pages()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Re-stored {moved} files ({duplicates} duplicates merged, {missing} missing). "
+            f"The original flat files are left in place."
+        ))
@@ -0,0 +1,58 @@
+# vendor_assets.py - Download the front-end libraries into App/static/vendor/
+import os
+import posixpath
+import re
+import urllib.request
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from App.templatetags.assets import is_vendored
+
+STATIC_DIR = os.path.join(settings.BASE_DIR, 'App', 'static')
+CSS_URL_PATTERN = re.compile(r'''url\(\s*['"]?([^'")]+)['"]?\s*\)''')
+
+
+class Command(BaseCommand):
+    help = "Download the libraries listed in settings.VENDOR_ASSETS so no CDN is needed"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Download again even if a copy exists')
+
+    def handle(self, *args, **options):
+        for name, asset in settings.VENDOR_ASSETS.items():
+            if is_vendored(asset['path']) and not options['force']:
+                self.stdout.write(f"{name}: already vendored")
+                continue
+
+            self.stdout.write(f"{name}: downloading {asset['url']}")
+            data = self.download(asset['url'], asset['path'])
+
+            # Stylesheets pull in fonts and sprites - fetch those next to them
+            if asset['path'].endswith('.css'):
+                for reference in set(CSS_URL_PATTERN.findall(data.decode('utf-8', 'replace'))):
+                    if reference.startswith(('data:', 'http:', 'https:', '//', '/')):
+                        continue
+                    relative = reference.split('?')[0].split('#')[0]
+                    self.download(
+                        posixpath.join(posixpath.dirname(asset['url']), relative),
+                        posixpath.normpath(posixpath.join(posixpath.dirname(asset['path']), relative)),
+                    )
+
+        is_vendored.cache_clear()
+        self.stdout.write(self.style.SUCCESS("Vendored assets are up to date"))
+
+    def download(self, url, path):
+        """Fetch url and write it to App/static/<path>"""
+        try:
+            with urllib.request.urlopen(url, timeout=30) as response:
+                data = response.read()
+        except OSError as e:
+            raise CommandError(f"Could not download {url}: {e}")
+
+        target = os.path.join(STATIC_DIR, *path.split('/'))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as f:
+            f.write(data)
+        self.stdout.write(f"  -> {path} ({len(data)} bytes)")
+        return data
@@ -0,0 +1,130 @@
+# warm_caches.py - Fill the shared caches after a deploy so the first listeners do not pay for it
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.test import RequestFactory
+
+from App import caching
+from App.catalogue import batched
+from App.models import Song, SongPlayStats
+from App.signals import MEDIA_FIELDS
+from App.views import render_index_page
+
+
+def lyrics_entries(songs):
+    """Converted lyrics for songs whose lyrics are not JSON yet (JSON is served as it is)"""
+    return {caching.lyrics_key(song): song.convert_lyrics_to_json()
+            for _, song in songs if song.lyrics and not song.lyrics_are_formatted()}
+
+
+def warm_songs(items, generation, do_pages, do_media):
+    """Render pages and stat media for (page number, song) pairs; runs on a pool thread"""
+    entries = {}
+    counts = {'pages': 0, 'media': 0, 'errors': 0}
+    factory = RequestFactory()
+    try:
+        for page_number, song in items:
+            try:
+                if do_pages:
+                    if page_number is None:
+                        page_number = Song.objects.filter(id__lt=song.id).count() + 1
+                    request = factory.get('/', {'page': page_number})
+                    entries[caching.index_page_key(page_number, generation)] = render_index_page(
+                        request, str(page_number))
+                    counts['pages'] += 1
+
+                if do_media:
+                    for field_name in MEDIA_FIELDS:
+                        field_file = getattr(song, field_name)
+                        if field_file and caching.is_immutable(field_file.name):
+                            entries[caching.media_key(field_file.name)] = caching.stat_media(
+                                field_file.name, field_file.path)
+                            counts['media'] += 1
+            except Exception as e:
+                counts['errors'] += 1
+                print(f"Could not warm song {song.id}: {e}")
+    finally:
+        # Pool threads keep their own DB connections - do not leak them
+        connections.close_all()
+    return entries, counts
+
+
+class Command(BaseCommand):
+    help = "Pre-normalize lyrics, pre-render index pages and pre-compute media ETags/sizes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, help='Only the N most played songs')
+        parser.add_argument('--workers', type=int, default=4, help='Threads computing entries')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Songs read and written per batch')
+        parser.add_argument('--skip-lyrics', action='store_true')
+        parser.add_argument('--skip-pages', action='store_true')
+        parser.add_argument('--skip-media', action='store_true')
+
+    def handle(self, *args, **options):
+        do_lyrics = not options['skip_lyrics']
+        do_pages = not options['skip_pages']
+        do_media = not options['skip_media']
+        if do_pages and not getattr(settings, 'CACHE_INDEX_PAGES', False):
+            self.stderr.write(self.style.WARNING("CACHE_INDEX_PAGES is off - not rendering pages"))
+            do_pages = False
+
+        songs = Song.objects.order_by('id')
+        if options['top']:
+            top_ids = list(SongPlayStats.objects.order_by('-play_count')
+                           .values_list('song_id', flat=True)[:options['top']])
+            songs = songs.filter(id__in=top_ids)
+            total = len(top_ids)
+
+            def numbered(iterator):
+                # Page numbers are looked up per song by the workers
+                return ((None, song) for song in iterator)
+        else:
+            total = songs.count()
+
+            def numbered(iterator):
+                # One song per page, in id order: the n-th song is page n
+                return enumerate(iterator, 1)
+
+        cache = caching.cache()
+        generation = caching.page_generation()
+        done = 0
+        totals = {'lyrics': 0, 'pages': 0, 'media': 0, 'errors': 0}
+        started = time.perf_counter()
+        self.stdout.write(f"Warming caches for {total} songs with {options['workers']} workers")
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            for chunk in batched(numbered(songs.iterator(chunk_size=options['chunk_size'])), options['chunk_size']):
+                # All cache writes happen here, on this thread: with a database cache, pool
+                # threads writing while this cursor is open would wait on the database lock.
+                # Lyrics go first - rendering the pages reads them.
+                if do_lyrics or do_pages:
+                    entries = lyrics_entries(chunk)
+                    with transaction.atomic():
+                        cache.set_many(entries, None)
+                    totals['lyrics'] += len(entries)
+
+                if do_pages or do_media:
+                    slice_size = max(1, -(-len(chunk) // options['workers']))
+                    futures = [pool.submit(warm_songs, chunk[i:i + slice_size], generation, do_pages, do_media)
+                               for i in range(0, len(chunk), slice_size)]
+                    entries = {}
+                    for future in futures:
+                        slice_entries, counts = future.result()
+                        entries.update(slice_entries)
+                        for key, value in counts.items():
+                            totals[key] += value
+                    # One transaction per chunk (one commit for a database cache)
+                    with transaction.atomic():
+                        cache.set_many(entries, None)
+
+                done += len(chunk)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f"  {done}/{total} songs ({done / elapsed:.0f}/s)")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Warmed {totals['lyrics']} lyrics, {totals['pages']} pages and {totals['media']} media files "
+            f"in {time.perf_counter() - started:.1f}s ({totals['errors']} errors)"
+        ))
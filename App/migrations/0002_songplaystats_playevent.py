@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('App', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SongPlayStats',
+            fields=[
+                ('song', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='play_stats', serialize=False, to='App.song')),
+                ('play_count', models.PositiveIntegerField(db_index=True, default=0)),
+                ('last_played_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PlayEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event', models.CharField(choices=[('play', 'Play'), ('pause', 'Pause'), ('ended', 'Ended')], max_length=10)),
+                ('position', models.FloatField(default=0)),
+                ('session_key', models.CharField(blank=True, max_length=40)),
+                ('created_at', models.DateTimeField(db_index=True)),
+                ('song', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='play_events', to='App.song')),
+            ],
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('App', '0003_mediablob_alter_song_audio_file_alter_song_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LyricsEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ticket', models.CharField(blank=True, db_index=True, max_length=32)),
+                ('status', models.CharField(choices=[('ready', 'Ready'), ('not_found', 'Not found'), ('error', 'Error')], max_length=10)),
+                ('payload', models.TextField(blank=True)),
+                ('message', models.CharField(blank=True, max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('song', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='lyrics_events', to='App.song')),
+            ],
+        ),
+    ]
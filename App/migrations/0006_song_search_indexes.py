@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:45
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('App', '0005_warm_cache_table'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='song',
+            index=models.Index(django.db.models.functions.text.Lower('title'), name='app_song_title_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='song',
+            index=models.Index(django.db.models.functions.text.Lower('artist'), name='app_song_artist_lower_idx'),
+        ),
+    ]
@@ -1,34 +1,65 @@
 # models.py - Updated to handle both plain text and JSON lyrics
 from django.db import models
+from django.db.models.functions import Lower
 import json
 import re
 
+# Largest id the database can store (signed 64-bit)
+MAX_SONG_ID = 2 ** 63 - 1
+
 class Song(models.Model):
     title = models.TextField()
     artist = models.TextField()
-    image = models.ImageField()
-    audio_file = models.FileField()
+    # Stored content-addressed (see storage.ContentAddressedStorage), the folder is kept as a prefix
+    image = models.ImageField(upload_to='covers/')
+    audio_file = models.FileField(upload_to='audio/')
     audio_link = models.CharField(max_length=200, blank=True, null=True)
     lyrics = models.TextField(blank=True, null=True)  # Can store plain text or JSON
     duration = models.TextField(max_length=20)
     paginate_by = 2
 
+    class Meta:
+        indexes = [
+            # Case-insensitive prefix search in the admin (SongAdmin.get_search_results)
+            models.Index(Lower('title'), name='app_song_title_lower_idx'),
+            models.Index(Lower('artist'), name='app_song_artist_lower_idx'),
+        ]
+
     def get_formatted_lyrics(self):
         """Convert lyrics to the expected JSON format for the player"""
         if not self.lyrics:
             return "[]"
         
+        if self.lyrics_are_formatted():
+            return self.lyrics  # Already in correct format
+        
+        # Convert plain text or LRC format to JSON (cached per version of the lyrics)
+        from .caching import formatted_lyrics
+        return formatted_lyrics(self)
+    
+    def lyrics_are_formatted(self):
+        """True when the lyrics are already the player's JSON list of timed lines"""
         # Try to parse as JSON first (if already formatted)
         try:
             parsed = json.loads(self.lyrics)
             if isinstance(parsed, list) and len(parsed) > 0:
                 if isinstance(parsed[0], dict) and 'time' in parsed[0]:
-                    return self.lyrics  # Already in correct format
-        except (json.JSONDecodeError, KeyError):
+                    return True
+        except (json.JSONDecodeError, KeyError, TypeError):
             pass
-        
-        # Convert plain text or LRC format to JSON
-        return self.convert_lyrics_to_json()
+        return False
+    
+    def has_plain_text_lyrics(self):
+        """True when the lyrics carry no timing at all (neither JSON nor LRC)"""
+        if not self.lyrics or not self.lyrics.strip():
+            return False
+        if self.lyrics.lstrip().startswith('['):
+            try:
+                json.loads(self.lyrics)
+                return False
+            except json.JSONDecodeError:
+                pass
+        return not re.search(r'^\s*\[\d+:\d+', self.lyrics, re.MULTILINE)
     
     def convert_lyrics_to_json(self):
         """Convert plain text or LRC format lyrics to JSON format"""
@@ -62,7 +93,8 @@ class Song(models.Model):
                     "lyrics": text
                 })
             else:
-                # Plain text - assign approximate timestamps
+                # Plain text - assign approximate timestamps until
+                # alignment.align_song_lyrics has timed them against the audio
                 minutes = current_time // 60
                 seconds = current_time % 60
                 formatted_time = f"{minutes}:{seconds:02d}"
@@ -76,4 +108,62 @@ class Song(models.Model):
         return json.dumps(formatted_lyrics)
     
     def __str__(self):
-        return self.title
\ No newline at end of file
+        return self.title
+
+
+class PlayEvent(models.Model):
+    """Raw player event (play/pause/ended), written in batches by play_events.PlayEventBuffer"""
+    EVENT_CHOICES = [
+        ('play', 'Play'),
+        ('pause', 'Pause'),
+        ('ended', 'Ended'),
+    ]
+
+    song = models.ForeignKey(Song, on_delete=models.CASCADE, related_name='play_events')
+    event = models.CharField(max_length=10, choices=EVENT_CHOICES)
+    position = models.FloatField(default=0)  # Seconds into the track
+    session_key = models.CharField(max_length=40, blank=True)
+    created_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.event} {self.song_id} @ {self.position:.0f}s"
+
+
+class SongPlayStats(models.Model):
+    """Rolled-up play counters per song, kept current on every buffer flush"""
+    song = models.OneToOneField(Song, on_delete=models.CASCADE, primary_key=True, related_name='play_stats')
+    play_count = models.PositiveIntegerField(default=0, db_index=True)
+    last_played_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.song_id}: {self.play_count} plays"
+
+
+class MediaBlob(models.Model):
+    """Reference count for a content-addressed media file shared by identical uploads"""
+    name = models.CharField(max_length=255, unique=True)
+    size = models.BigIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=1)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} refs)"
+
+
+class LyricsEvent(models.Model):
+    """Outcome of a lyrics lookup, streamed to subscribed players by lyrics_events.event_stream"""
+    STATUS_CHOICES = [
+        ('ready', 'Ready'),
+        ('not_found', 'Not found'),
+        ('error', 'Error'),
+    ]
+
+    song = models.ForeignKey(Song, on_delete=models.CASCADE, null=True, blank=True, related_name='lyrics_events')
+    ticket = models.CharField(max_length=32, blank=True, db_index=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES)
+    payload = models.TextField(blank=True)  # Lyrics JSON when status is ready
+    message = models.CharField(max_length=200, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.status} song={self.song_id} ticket={self.ticket}"
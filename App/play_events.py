@@ -0,0 +1,158 @@
+# play_events.py - Write-behind buffer for player events and the rolled-up charts
+import atexit
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import Song, PlayEvent, SongPlayStats
+
+# A "play" this close to the start of the track counts as a new listen;
+# later ones are resumes after a pause.
+PLAY_START_WINDOW = 5  # seconds
+
+
+class PlayEventBuffer:
+    """Collects events in memory and writes them with one bulk insert per flush"""
+
+    def __init__(self, max_size=100, flush_interval=10):
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self._events = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer = None
+
+    def add(self, song_id, event, position=0, session_key=''):
+        """Queue one event; flushes inline only when the buffer is full"""
+        with self._lock:
+            self._events.append(PlayEvent(
+                song_id=song_id,
+                event=event,
+                position=position,
+                session_key=session_key or '',
+                created_at=timezone.now(),
+            ))
+            full = len(self._events) >= self.max_size
+            self._start_timer()
+
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Write all buffered events and update the aggregates; returns the number written"""
+        with self._lock:
+            events, self._events = self._events, []
+        if not events:
+            return 0
+
+        # One writer at a time keeps the counter updates from interleaving
+        with self._flush_lock:
+            try:
+                write_events(events)
+                return len(events)
+            except Exception as e:
+                print(f"Error flushing {len(events)} play events: {e} - writing them one by one")
+
+            # One bad row must not cost the whole batch
+            written, retry = 0, []
+            for event in events:
+                try:
+                    write_events([event])
+                    written += 1
+                except OperationalError as e:
+                    # Database busy or unavailable - the event itself is fine
+                    print(f"Play event kept for the next flush: {e}")
+                    retry.append(event)
+                except Exception as e:
+                    print(f"Dropping play event {event.event} for song {event.song_id}: {e}")
+
+        if retry:
+            self._requeue(retry)
+        return written
+
+    def _requeue(self, events):
+        """Put unwritten events back in front of the buffer, keeping at most 10 flushes' worth"""
+        with self._lock:
+            self._events = (events + self._events)[-self.max_size * 10:]
+            self._start_timer()
+
+    def _start_timer(self):
+        """Background flush so quiet periods do not keep events in memory (lock held)"""
+        if self._timer is not None and self._timer.is_alive():
+            return
+        self._timer = threading.Thread(target=self._run_timer, name='play-event-flush', daemon=True)
+        self._timer.start()
+
+    def _run_timer(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+            with self._lock:
+                if not self._events:
+                    self._timer = None
+                    return
+
+
+def write_events(events):
+    """Bulk insert raw events and fold them into SongPlayStats"""
+    # Beacons carry client-supplied ids - drop events for songs that no longer exist
+    existing = set(Song.objects.filter(id__in={e.song_id for e in events}).values_list('id', flat=True))
+    events = [e for e in events if e.song_id in existing]
+    if not events:
+        return
+
+    plays = defaultdict(int)
+    last_played = {}
+    for event in events:
+        if event.event != 'play':
+            continue
+        if event.position < PLAY_START_WINDOW:
+            plays[event.song_id] += 1
+        last_played[event.song_id] = max(event.created_at, last_played.get(event.song_id, event.created_at))
+
+    with transaction.atomic():
+        PlayEvent.objects.bulk_create(events, batch_size=500)
+
+        if last_played:
+            SongPlayStats.objects.bulk_create(
+                [SongPlayStats(song_id=song_id) for song_id in last_played],
+                ignore_conflicts=True,
+            )
+            for song_id, played_at in last_played.items():
+                SongPlayStats.objects.filter(song_id=song_id).update(
+                    play_count=F('play_count') + plays[song_id],
+                    last_played_at=Greatest(Coalesce(F('last_played_at'), Value(played_at)), Value(played_at)),
+                )
+
+
+def most_played(limit=10):
+    """Top songs by play count, read straight from the aggregate table"""
+    return (SongPlayStats.objects
+            .filter(play_count__gt=0)
+            .select_related('song')
+            .only('play_count', 'last_played_at', 'song__id', 'song__title', 'song__artist')
+            .order_by('-play_count')[:limit])
+
+
+def recently_played(limit=10):
+    """Songs ordered by their latest play"""
+    return (SongPlayStats.objects
+            .filter(last_played_at__isnull=False)
+            .select_related('song')
+            .only('play_count', 'last_played_at', 'song__id', 'song__title', 'song__artist')
+            .order_by('-last_played_at')[:limit])
+
+
+buffer = PlayEventBuffer(
+    max_size=getattr(settings, 'PLAY_EVENTS_BUFFER_SIZE', 100),
+    flush_interval=getattr(settings, 'PLAY_EVENTS_FLUSH_INTERVAL', 10),
+)
+
+# Do not lose the tail of the buffer on a clean shutdown
+atexit.register(buffer.flush)
@@ -0,0 +1,42 @@
+# preload.py - Do the expensive start-up work once in the parent, before workers are forked
+#
+# gunicorn.conf.py calls preload() in the master after the WSGI application is
+# loaded. Everything imported or built here is inherited by every worker and
+# shared copy-on-write, instead of being paid again by each worker's first request.
+import gc
+import time
+
+from django.conf import settings
+from django.db import connections
+
+
+def preload(freeze=True):
+    """Warm imports, URLs, templates and the static manifest; returns the seconds it took"""
+    started = time.perf_counter()
+
+    # The URLconf pulls in the views and everything they import (syncedlyrics, numpy...)
+    from django.urls import get_resolver, reverse
+    get_resolver().url_patterns
+    reverse('App:index')  # Builds the reverse lookup tables
+
+    # Cached template loader (DEBUG off): compiled templates stay in memory
+    from django.template.loader import get_template
+    for name in ('index.html', 'main.html'):
+        get_template(name)
+
+    # Manifest of hashed static names, read once
+    if not settings.DEBUG:
+        from django.contrib.staticfiles.storage import staticfiles_storage
+        staticfiles_storage.url('script.js')
+
+    from . import caching
+    caching.build_id()
+
+    # Connections must not be shared between processes
+    connections.close_all()
+
+    if freeze:
+        # Keep the collector from touching (and so un-sharing) every inherited object
+        gc.collect()
+        gc.freeze()
+    return time.perf_counter() - started
@@ -0,0 +1,205 @@
+# profiling.py - Opt-in per-request profiling (cProfile or stack sampling) with a SQL log
+#
+# Off unless settings.PROFILING_ENABLED: the middleware then raises
+# MiddlewareNotUsed and Django drops it from the stack entirely. When enabled,
+# a request is profiled if it carries a signed token (X-Profile header or
+# ?profile= parameter, see `manage.py profile_token`) or is picked by
+# PROFILING_SAMPLE_RATE. Everything else passes straight through.
+#
+# Output per profiled request, in PROFILING_DIR:
+#   <id>.prof       pstats dump (cprofile mode)  - python -m pstats, snakeviz
+#   <id>.collapsed  collapsed stacks (sample mode) - flamegraph.pl, speedscope
+#   <id>.sql.json   request summary and every query with its duration
+#                   (parameters of session and auth queries are redacted)
+import cProfile
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+TOKEN_SALT = 'App.profiling'
+MODES = ('cprofile', 'sample')
+# Queries on these tables carry session keys, session data and password hashes
+SENSITIVE_TABLES = re.compile(r'\b(django_session|auth_\w+)\b', re.IGNORECASE)
+
+# One cProfile run at a time per process: from Python 3.12 it hooks sys.monitoring,
+# which a second profiler cannot enable (ValueError), and it sees every thread.
+_cprofile_lock = threading.Lock()
+
+
+def make_token(mode='cprofile'):
+    """Signed token that switches profiling on for a request (valid PROFILING_TOKEN_MAX_AGE seconds)"""
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(mode)
+
+
+def read_token(token):
+    """Mode encoded in a valid token, or None"""
+    try:
+        mode = signing.TimestampSigner(salt=TOKEN_SALT).unsign(
+            token, max_age=getattr(settings, 'PROFILING_TOKEN_MAX_AGE', 3600))
+    except signing.BadSignature:
+        return None
+    return mode if mode in MODES else None
+
+
+def logged_path(request):
+    """Request path and query string without the profile token"""
+    query = request.GET.copy()
+    query.pop('profile', None)
+    return f"{request.path}?{query.urlencode()}" if query else request.path
+
+
+class QueryLog:
+    """Database execute wrapper recording each query with its duration"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'alias': context['connection'].alias,
+                'sql': sql,
+                'params': '<redacted>' if SENSITIVE_TABLES.search(sql) else repr(params)[:500],
+                'many': many,
+                'ms': round((time.perf_counter() - started) * 1000, 3),
+            })
+
+
+class StackSampler:
+    """Samples one thread's Python stack every `interval` seconds into collapsed-stack counts"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.counts = Counter()
+        self._target = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name='melophile-profiler')
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.counts[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return ''.join(f"{stack} {count}\n" for stack, count in self.counts.most_common())
+
+
+class ProfilingMiddleware:
+    """Profile requests that ask for it; list it first in MIDDLEWARE to cover the whole stack"""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0.0)
+        self.default_mode = getattr(settings, 'PROFILING_MODE', 'cprofile')
+        self.output_dir = getattr(settings, 'PROFILING_DIR', os.path.join(settings.BASE_DIR, '.cache', 'profiles'))
+        os.makedirs(self.output_dir, exist_ok=True)
+
+    def __call__(self, request):
+        mode = self.requested_mode(request)
+        if mode is None:
+            return self.get_response(request)
+        return self.profile(request, mode)
+
+    def requested_mode(self, request):
+        token = request.headers.get('X-Profile') or request.GET.get('profile')
+        if token:
+            return read_token(token)
+        if self.sample_rate and random.random() < self.sample_rate:
+            return self.default_mode
+        return None
+
+    def profile(self, request, mode):
+        if mode == 'cprofile' and not _cprofile_lock.acquire(blocking=False):
+            # Another thread is being profiled: sample this one instead of waiting
+            mode = 'sample'
+        try:
+            return self.run_profiled(request, mode)
+        finally:
+            if mode == 'cprofile':
+                _cprofile_lock.release()
+
+    def run_profiled(self, request, mode):
+        query_log = QueryLog()
+        profiler = cProfile.Profile() if mode == 'cprofile' else StackSampler(
+            getattr(settings, 'PROFILING_SAMPLE_INTERVAL', 0.005))
+
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(query_log))
+            if mode == 'cprofile':
+                profiler.enable()
+            else:
+                profiler.start()
+            try:
+                response = self.get_response(request)
+            finally:
+                if mode == 'cprofile':
+                    profiler.disable()
+                else:
+                    profiler.stop()
+        elapsed = time.perf_counter() - started
+
+        # Streaming responses are only profiled up to the point the body starts
+        view = request.resolver_match.url_name if request.resolver_match else 'unresolved'
+        profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{view}-{uuid.uuid4().hex[:8]}"
+        self.save(profile_id, request, response, mode, profiler, query_log, elapsed)
+        response['X-Profile-Id'] = profile_id
+        return response
+
+    def save(self, profile_id, request, response, mode, profiler, query_log, elapsed):
+        base = os.path.join(self.output_dir, profile_id)
+        try:
+            if mode == 'cprofile':
+                profiler.dump_stats(base + '.prof')
+            else:
+                with open(base + '.collapsed', 'w', encoding='utf-8') as f:
+                    f.write(profiler.collapsed())
+
+            summary = {
+                'id': profile_id,
+                'method': request.method,
+                'path': logged_path(request),
+                'status': response.status_code,
+                'mode': mode,
+                'total_ms': round(elapsed * 1000, 3),
+                'query_count': len(query_log.queries),
+                'query_ms': round(sum(q['ms'] for q in query_log.queries), 3),
+                'queries': query_log.queries,
+            }
+            with open(base + '.sql.json', 'w', encoding='utf-8') as f:
+                json.dump(summary, f, indent=2)
+            print(f"Profiled {request.method} {request.path} in {summary['total_ms']:.1f}ms "
+                  f"({summary['query_count']} queries) -> {profile_id}")
+        except OSError as e:
+            print(f"Could not write profile {profile_id}: {e}")
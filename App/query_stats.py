@@ -0,0 +1,203 @@
+# query_stats.py - Learn which lyric search queries find results and try those first
+#
+# Hit/miss counts per query variant are kept in a small JSON file, overall, per
+# script (latin, devanagari, ...) and per artist. Lookups order the variants by
+# their estimated hit rate, with the narrower counts leaning on the wider ones
+# until they have enough data of their own, and skip variants that almost never
+# work. No Django imports: test.py's LyricsFetcher uses this module as well.
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import unicodedata
+
+try:
+    import fcntl
+except ImportError:  # Windows: concurrent writers may lose a few counts
+    fcntl = None
+
+# Query variants by name; callers pick which ones they are willing to try
+VARIANTS = {
+    'artist_title': '{artist} {title}',
+    'title_artist': '{title} {artist}',
+    'artist_dash_title': '{artist} - {title}',
+    'quoted': '"{artist}" "{title}"',
+    'title': '{title}',
+    'title_lyrics': '{title} lyrics',
+}
+
+# A provider result only counts as a hit when it is synced, i.e. has LRC timestamps
+LRC_TIMESTAMP = re.compile(r'\[\d+:\d+[.:]\d+\]')
+
+# A variant is skipped once it has this many tries and a hit rate below SKIP_BELOW...
+SKIP_MIN_TRIES = 30
+SKIP_BELOW = 0.02
+# ...except for this share of lookups, so a skipped variant can earn its place back
+EXPLORE_RATE = 0.05
+# How many tries of its own a narrower level needs before it counts as much as its parent
+PRIOR_WEIGHT = 5
+# save_if_due() writes the file after this many lookups or seconds, whichever comes first
+SAVE_EVERY_LOOKUPS = 50
+SAVE_INTERVAL = 60
+# Artists kept in the file (the most tried ones); the rest fall back to their script's counts
+MAX_ARTISTS = 5000
+
+
+def build_query(variant, artist, title):
+    return VARIANTS[variant].format(artist=artist, title=title)
+
+
+def is_hit(lrc):
+    """True when a provider result has synced lyrics - the one definition every caller records"""
+    return bool(lrc and LRC_TIMESTAMP.search(lrc))
+
+
+def script_of(text):
+    """Dominant Unicode script of the letters in text, e.g. 'LATIN' or 'DEVANAGARI'"""
+    counts = {}
+    for char in text:
+        if char.isalpha():
+            script = unicodedata.name(char, 'UNKNOWN').split(' ')[0]
+            counts[script] = counts.get(script, 0) + 1
+    return max(counts, key=counts.get) if counts else 'UNKNOWN'
+
+
+class QueryStats:
+    """Persistent hit/miss counts per query variant, safe to share between threads and processes"""
+
+    def __init__(self, path, by_artist=True, max_artists=MAX_ARTISTS):
+        self.path = path
+        self.by_artist = by_artist
+        self.max_artists = max_artists
+        self._lock = threading.Lock()
+        self._data = self._empty()
+        self._delta = self._empty()
+        self._last_save = time.monotonic()
+        self._load()
+
+    @staticmethod
+    def _empty():
+        return {'global': {}, 'script': {}, 'artist': {}, 'lookups': {'count': 0, 'calls': 0, 'found': 0}}
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        for key, value in self._empty().items():
+            data.setdefault(key, value)
+        self._data = data
+
+    def _levels(self, artist, title):
+        """(table, key) pairs from the widest level to the narrowest"""
+        levels = [('global', ''), ('script', script_of(f'{artist} {title}'))]
+        if self.by_artist and artist.strip():
+            levels.append(('artist', artist.strip().lower()))
+        return levels
+
+    def _counts(self, table, key, variant):
+        counts = self._data[table].get(key, {}).get(variant, [0, 0])
+        delta = self._delta[table].get(key, {}).get(variant, [0, 0])
+        return counts[0] + delta[0], counts[1] + delta[1]
+
+    def hit_rate(self, variant, artist='', title=''):
+        """Estimated chance that this variant finds lyrics for the song"""
+        rate = 0.5
+        with self._lock:
+            for table, key in self._levels(artist, title):
+                hits, tries = self._counts(table, key, variant)
+                rate = (hits + rate * PRIOR_WEIGHT) / (tries + PRIOR_WEIGHT)
+        return rate
+
+    def order(self, variants, artist, title):
+        """Variants worth trying for this song, most promising first"""
+        explore = random.random() < EXPLORE_RATE
+        scored = []
+        for position, variant in enumerate(variants):
+            rate = self.hit_rate(variant, artist, title)
+            with self._lock:
+                _, tries = self._counts('global', '', variant)
+            if not explore and tries >= SKIP_MIN_TRIES and rate < SKIP_BELOW:
+                continue
+            scored.append((-rate, position, variant))
+        if not scored:
+            return list(variants)
+        return [variant for _, _, variant in sorted(scored)]
+
+    def record(self, variant, artist, title, hit):
+        """Count one provider call made with this variant"""
+        with self._lock:
+            for table, key in self._levels(artist, title):
+                counts = self._delta[table].setdefault(key, {}).setdefault(variant, [0, 0])
+                counts[0] += 1 if hit else 0
+                counts[1] += 1
+
+    def record_lookup(self, calls, found):
+        """Count one whole lookup (for the average number of provider calls)"""
+        with self._lock:
+            lookups = self._delta['lookups']
+            lookups['count'] += 1
+            lookups['calls'] += calls
+            lookups['found'] += 1 if found else 0
+
+    def summary(self):
+        with self._lock:
+            lookups = {k: self._data['lookups'][k] + self._delta['lookups'][k] for k in self._delta['lookups']}
+            variants = {variant: self._counts('global', '', variant) for variant in VARIANTS}
+        lookups['calls_per_lookup'] = lookups['calls'] / lookups['count'] if lookups['count'] else 0.0
+        return {'lookups': lookups, 'variants': variants}
+
+    def save_if_due(self):
+        """save() once enough lookups or time have gone by since the last one; True when it saved"""
+        with self._lock:
+            due = (self._delta['lookups']['count'] >= SAVE_EVERY_LOOKUPS or
+                   time.monotonic() - self._last_save >= SAVE_INTERVAL)
+        if due:
+            self.save()
+        return due
+
+    def save(self):
+        """Merge this process's new counts into the file (re-reading what other processes wrote)"""
+        with self._lock:
+            self._last_save = time.monotonic()
+            if self._delta == self._empty():
+                return
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            with open(self.path + '.lock', 'a') as lock:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                self._load()
+                self._merge(self._data, self._delta)
+                self._prune_artists()
+                self._delta = self._empty()
+
+                fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(self._data, f, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+
+    def _prune_artists(self):
+        """Keep the max_artists artists with the most tries"""
+        artists = self._data['artist']
+        if len(artists) <= self.max_artists:
+            return
+        tries = {key: sum(counts[1] for counts in variants.values()) for key, variants in artists.items()}
+        keep = sorted(tries, key=tries.get, reverse=True)[:self.max_artists]
+        self._data['artist'] = {key: artists[key] for key in keep}
+
+    @staticmethod
+    def _merge(data, delta):
+        for table in ('global', 'script', 'artist'):
+            for key, variants in delta[table].items():
+                target = data[table].setdefault(key, {})
+                for variant, (hits, tries) in variants.items():
+                    counts = target.setdefault(variant, [0, 0])
+                    counts[0] += hits
+                    counts[1] += tries
+        for key, value in delta['lookups'].items():
+            data['lookups'][key] = data['lookups'].get(key, 0) + value
@@ -0,0 +1,174 @@
+# ratelimit.py - Token buckets per client and a cap on in-flight provider lookups
+import ipaddress
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+
+try:
+    import fcntl
+except ImportError:  # Windows: limits then only hold within one process
+    fcntl = None
+
+_thread_lock = threading.Lock()
+
+
+def lock_dir():
+    path = getattr(settings, 'RATE_LIMIT_LOCK_DIR', os.path.join(settings.BASE_DIR, '.cache', 'locks'))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+@contextmanager
+def _bucket_lock():
+    """Serialize bucket updates across threads and, where supported, processes"""
+    with _thread_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(lock_dir(), 'buckets.lock'), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def take_token(scope, ident, capacity, per_minute):
+    """
+    Take one token from the bucket for (scope, ident).
+
+    Returns 0 when the request may go ahead, otherwise the number of seconds
+    until the next token is available.
+    """
+    cache = caches[getattr(settings, 'RATE_LIMIT_CACHE', 'default')]
+    key = f'ratelimit:{scope}:{ident}'
+    refill_rate = per_minute / 60.0
+    now = time.time()
+
+    with _bucket_lock():
+        tokens, updated_at = cache.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated_at) * refill_rate)
+        if tokens >= 1:
+            wait = 0
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / refill_rate
+        # Idle buckets are full again after this long - let them expire
+        cache.set(key, (tokens, now), timeout=math.ceil(capacity / refill_rate) + 1)
+    return wait
+
+
+def _is_trusted_proxy(address):
+    """True when address is in settings.RATE_LIMIT_TRUSTED_PROXIES (addresses or networks)"""
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(proxy, strict=False)
+               for proxy in getattr(settings, 'RATE_LIMIT_TRUSTED_PROXIES', []))
+
+
+def client_ip(request):
+    """
+    Address of the client, looking through trusted reverse proxies.
+
+    Behind a proxy REMOTE_ADDR is the proxy itself, the same for every
+    client. X-Forwarded-For is only read when REMOTE_ADDR is trusted, and is
+    walked from the right: the first address no trusted proxy added is the
+    client (anything further left could be forged by that client).
+    """
+    address = request.META.get('REMOTE_ADDR', 'unknown')
+    if not _is_trusted_proxy(address):
+        return address
+
+    forwarded = [hop.strip() for hop in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if hop.strip()]
+    for hop in reversed(forwarded):
+        address = hop
+        if not _is_trusted_proxy(hop):
+            break
+    return address
+
+
+def too_many_requests(retry_after, message):
+    retry_after = max(1, math.ceil(retry_after))
+    response = JsonResponse({
+        'success': False,
+        'message': message,
+        'retry_after': retry_after,
+    }, status=429)
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+def rate_limited(scope):
+    """View decorator applying settings.RATE_LIMITS[scope] per client IP (see client_ip)"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            limits = getattr(settings, 'RATE_LIMITS', {}).get(scope)
+            if limits:
+                wait = take_token(f'{scope}:ip', client_ip(request), limits['capacity'], limits['per_minute'])
+                if wait:
+                    return too_many_requests(wait, 'Too many requests, please slow down')
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TooManyLookups(Exception):
+    """All provider lookup slots are busy"""
+
+    def __init__(self, retry_after=2):
+        super().__init__('All lyric lookup slots are busy')
+        self.retry_after = retry_after
+
+
+_local_slots = None
+
+
+@contextmanager
+def lookup_slot():
+    """
+    Hold one of settings.MAX_CONCURRENT_LOOKUPS slots while talking to the provider.
+
+    Slots are lock files, so the cap holds across all worker processes on the
+    box and a crashed worker releases its slot automatically. Never blocks:
+    raises TooManyLookups when every slot is taken.
+    """
+    global _local_slots
+    slots = getattr(settings, 'MAX_CONCURRENT_LOOKUPS', 4)
+
+    if fcntl is None:
+        with _thread_lock:
+            if _local_slots is None:
+                _local_slots = threading.BoundedSemaphore(slots)
+        if not _local_slots.acquire(blocking=False):
+            raise TooManyLookups()
+        try:
+            yield
+        finally:
+            _local_slots.release()
+        return
+
+    directory = lock_dir()
+    for slot in range(slots):
+        f = open(os.path.join(directory, f'lookup-{slot}.lock'), 'a')
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            f.close()
+            continue
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+            f.close()
+        return
+    raise TooManyLookups()
@@ -0,0 +1,71 @@
+# signals.py - Media reference counting, lyric alignment and page cache upkeep when songs change
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import caching, jobs
+from .alignment import align_song_lyrics
+from .models import Song
+
+MEDIA_FIELDS = ('image', 'audio_file')
+
+
+@receiver(pre_save, sender=Song)
+def remember_previous_media(sender, instance, update_fields=None, **kwargs):
+    """Keep the stored names so replaced files can be released after the save"""
+    media_untouched = update_fields is not None and not set(update_fields) & set(MEDIA_FIELDS)
+    if instance.pk is None or media_untouched:
+        instance._previous_media = {}
+        instance._uploaded_media = set()
+        return
+    instance._previous_media = Song.objects.filter(pk=instance.pk).values(*MEDIA_FIELDS).first() or {}
+    # Files still to be written: saving them takes a new reference (storage._save)
+    instance._uploaded_media = {
+        field_name for field_name in MEDIA_FIELDS
+        if getattr(instance, field_name) and not getattr(instance, field_name)._committed
+    }
+
+
+@receiver(post_save, sender=Song)
+def release_replaced_media(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_media', None) or {}
+    uploaded = getattr(instance, '_uploaded_media', None) or set()
+    for field_name in MEDIA_FIELDS:
+        old_name = previous.get(field_name)
+        field_file = getattr(instance, field_name)
+        if old_name and (old_name != field_file.name or field_name in uploaded):
+            # Replaced - or the same bytes uploaded again, which added a second reference
+            field_file.storage.delete(old_name)
+    instance._previous_media = {}
+    instance._uploaded_media = set()
+
+
+@receiver(post_delete, sender=Song)
+def release_deleted_media(sender, instance, **kwargs):
+    for field_name in MEDIA_FIELDS:
+        field_file = getattr(instance, field_name)
+        if field_file:
+            field_file.storage.delete(field_file.name)
+
+
+@receiver(post_save, sender=Song)
+def schedule_lyrics_alignment(sender, instance, update_fields=None, **kwargs):
+    """Plain-text lyrics get timed against the audio in the background"""
+    if update_fields is not None and 'lyrics' not in update_fields:
+        return
+    if instance.audio_file and instance.has_plain_text_lyrics():
+        song_id = instance.pk
+        transaction.on_commit(lambda: jobs.submit(f'align:{song_id}', align_song_lyrics, song_id))
+
+
+@receiver(post_save, sender=Song)
+def forget_cached_pages(sender, instance, created=False, **kwargs):
+    if created:
+        caching.forget_pages_around(instance.pk)
+    else:
+        caching.forget_song_pages(instance.pk)
+
+
+@receiver(post_delete, sender=Song)
+def forget_cached_pages_on_delete(sender, instance, **kwargs):
+    caching.forget_pages_around(instance.pk)
@@ -5,7 +5,12 @@ var audioEnhancer = (function () {
   let lyricsData = [];
   let lyricsListEl, lyricsContainerEl;
   let isLyricsFetching = false;
+  let lyricsEvents = null; // EventSource for lyrics-events/
+  let lyricsSongId = null; // song waiting for lyrics from any source
+  let lyricsTicket = null; // lookup started from this page, while it runs
+  let nextTrackEl = null;
   const seekStep = 5; // seconds
+  const nextTrackWarmup = 30; // seconds before the end to buffer the next track
 
   function initMediaElement() {
     const media = $('audio.fc-media', 'body');
@@ -50,6 +55,11 @@ var audioEnhancer = (function () {
     audioEl.addEventListener('timeupdate', () => {
       $curr.text(formatTime(audioEl.currentTime));
       syncLyrics(audioEl.currentTime);
+
+      // Close to the end - buffer the next track so the change is gapless
+      if (audioEl.duration && audioEl.duration - audioEl.currentTime < nextTrackWarmup) {
+        prefetchNextTrack('auto');
+      }
     });
 
     // play/pause UI + fade
@@ -83,11 +93,16 @@ var audioEnhancer = (function () {
     audioEl.addEventListener('play', () => {
       $btnPlayPause.find('i').removeClass('fa-play').addClass('fa-pause');
       startWave();
+      prefetchNextTrack('metadata');
+      trackPlayEvent('play');
     });
     audioEl.addEventListener('pause', () => {
       $btnPlayPause.find('i').removeClass('fa-pause').addClass('fa-play');
       stopWave();
+      // 'ended' also fires a pause - report it once as ended
+      if (!audioEl.ended) trackPlayEvent('pause');
     });
+    audioEl.addEventListener('ended', () => trackPlayEvent('ended'));
 
     // seek buttons
     $btnBack.on('click', () => { audioEl.currentTime = Math.max(0, audioEl.currentTime - seekStep); });
@@ -106,6 +121,50 @@ var audioEnhancer = (function () {
       
       fetchLyricsFromBackend(artist, title, songId);
     });
+
+    // Songs without lyrics pick them up as soon as any tab, the admin or the aligner stores some
+    if ($('#btnFetchLyrics').length) {
+      lyricsSongId = $('.Melophile').data('song-id') || null;
+      watchLyricsEvents();
+    }
+  }
+
+  /* ===== Play Tracking ===== */
+  function trackPlayEvent(event) {
+    const songId = $('.Melophile').data('song-id');
+    if (!songId) return;
+
+    const payload = JSON.stringify({
+      song_id: songId,
+      event: event,
+      position: audioEl ? audioEl.currentTime : 0
+    });
+
+    // Fire-and-forget: the server buffers events, nothing to wait for
+    if (navigator.sendBeacon) {
+      navigator.sendBeacon('play-event/', new Blob([payload], { type: 'application/json' }));
+    } else {
+      fetch('play-event/', { method: 'POST', body: payload, keepalive: true,
+                             headers: { 'Content-Type': 'application/json' } }).catch(() => {});
+    }
+  }
+
+  /* ===== Next Track Prefetch ===== */
+  function prefetchNextTrack(preload) {
+    const shell = document.querySelector('main.tf-shell');
+    const src = shell && shell.dataset.nextAudio;
+    if (!src) return;
+
+    // Hidden element: the browser keeps the fetched bytes in its cache for the next page
+    if (!nextTrackEl) {
+      nextTrackEl = new Audio();
+      nextTrackEl.muted = true;
+      nextTrackEl.preload = preload;
+      nextTrackEl.src = src;
+    } else if (preload === 'auto' && nextTrackEl.preload !== 'auto') {
+      nextTrackEl.preload = 'auto';
+      nextTrackEl.load();
+    }
   }
 
   /* ===== Theme Toggle ===== */
@@ -190,7 +249,6 @@ var audioEnhancer = (function () {
     
     // Update button state
     const fetchBtn = $('#btnFetchLyrics');
-    const originalIcon = fetchBtn.find('i').attr('class');
     fetchBtn.find('i').attr('class', 'fa fa-spinner fa-spin');
     fetchBtn.prop('disabled', true);
 
@@ -215,6 +273,10 @@ var audioEnhancer = (function () {
         body: JSON.stringify(requestData)
     })
     .then(response => {
+      if (response.status === 429) {
+        const wait = response.headers.get('Retry-After') || 'a few';
+        throw new Error(`Too many requests - try again in ${wait} seconds`);
+      }
       if (!response.ok) {
         throw new Error(`HTTP ${response.status}: ${response.statusText}`);
       }
@@ -223,45 +285,99 @@ var audioEnhancer = (function () {
     .then(data => {
         console.log('Lyrics response:', data);
         
-        if (data.success && data.lyrics && data.lyrics.length > 0) {
-            lyricsData = data.lyrics;
-            
-            // Ensure all lyrics have timestamp field for precise syncing
-            lyricsData.forEach(item => {
-              if (typeof item.timestamp === 'undefined') {
-                item.timestamp = timeToSeconds(item.time);
-              }
-            });
-            
-            // Sort by timestamp to ensure correct order
-            lyricsData.sort((a, b) => a.timestamp - b.timestamp);
-            
-            console.log(`Loaded ${lyricsData.length} synced lyrics lines`);
-            console.log('First line:', lyricsData[0]);
-            console.log('Last line:', lyricsData[lyricsData.length - 1]);
-            
-            renderLyrics();
-            showLyricsMessage(`✅ ${data.message || 'Synced lyrics loaded!'}`, 'success');
-            
-            // Hide the fetch button since we now have lyrics
-            fetchBtn.fadeOut();
-            
-        } else {
-            throw new Error(data.message || 'No synced lyrics found');
+        if (data.success && data.pending) {
+            // The lookup runs on the server - the result comes over the event stream
+            lyricsTicket = data.ticket;
+            watchLyricsEvents(data.since);
+            return;
         }
+        throw new Error(data.message || 'No synced lyrics found');
     })
     .catch(error => {
         console.error('Failed to fetch lyrics:', error);
         showLyricsMessage(`❌ ${error.message}`, 'error');
-    })
-    .finally(() => {
-        isLyricsFetching = false;
-        // Restore button state
-        fetchBtn.find('i').attr('class', originalIcon);
-        fetchBtn.prop('disabled', false);
+        finishLyricsFetch();
     });
   }
 
+  function finishLyricsFetch() {
+    isLyricsFetching = false;
+    // Restore button state
+    const fetchBtn = $('#btnFetchLyrics');
+    fetchBtn.find('i').attr('class', 'fa fa-music');
+    fetchBtn.prop('disabled', false);
+  }
+
+  /* ===== Lyrics Events (Server-Sent Events) ===== */
+  // One stream per tab, for this song while it has no lyrics and for the lookup it started.
+  // Each open stream holds a server thread, so it closes on the song's first 'ready'.
+  function watchLyricsEvents(since) {
+    if (lyricsEvents) {
+      lyricsEvents.close();
+      lyricsEvents = null;
+    }
+    if (!window.EventSource) {
+      if (lyricsTicket) {
+        lyricsTicket = null;
+        showLyricsMessage('❌ Live updates are not supported by this browser', 'error');
+        finishLyricsFetch();
+      }
+      return;
+    }
+    if (!lyricsSongId && !lyricsTicket) return;
+
+    const params = new URLSearchParams();
+    if (lyricsSongId) params.append('song', lyricsSongId);
+    if (lyricsTicket) params.append('ticket', lyricsTicket);
+    if (since !== undefined) params.append('since', since);
+
+    lyricsEvents = new EventSource(`lyrics-events/?${params}`);
+    lyricsEvents.addEventListener('lyrics', (e) => {
+      const data = JSON.parse(e.data);
+      const forSong = lyricsSongId && data.song_id === Number(lyricsSongId);
+      const forTicket = lyricsTicket && data.ticket === lyricsTicket;
+      if (!forSong && !forTicket) return;
+
+      if (data.status === 'ready' && data.lyrics && data.lyrics.length > 0) {
+        // Whoever stored them, there is nothing left to wait for
+        lyricsSongId = null;
+        lyricsTicket = null;
+        lyricsEvents.close();
+        lyricsEvents = null;
+        applyFetchedLyrics(data.lyrics, data.message);
+      } else if (forTicket) {
+        // This page's lookup is over; keep listening for the song only
+        lyricsTicket = null;
+        showLyricsMessage(`❌ ${data.message || 'No synced lyrics found'}`, 'error');
+        finishLyricsFetch();
+        watchLyricsEvents(e.lastEventId);
+      }
+    });
+  }
+
+  function applyFetchedLyrics(lyrics, message) {
+    lyricsData = lyrics;
+    
+    // Ensure all lyrics have timestamp field for precise syncing
+    lyricsData.forEach(item => {
+      if (typeof item.timestamp === 'undefined') {
+        item.timestamp = timeToSeconds(item.time);
+      }
+    });
+    
+    // Sort by timestamp to ensure correct order
+    lyricsData.sort((a, b) => a.timestamp - b.timestamp);
+    
+    console.log(`Loaded ${lyricsData.length} synced lyrics lines`);
+    
+    renderLyrics();
+    showLyricsMessage(`✅ ${message || 'Synced lyrics loaded!'}`, 'success');
+    finishLyricsFetch();
+    
+    // Hide the fetch button since we now have lyrics
+    $('#btnFetchLyrics').fadeOut();
+  }
+
   function getCookie(name) {
     let cookieValue = null;
     if (document.cookie && document.cookie !== '') {
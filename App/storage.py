@@ -0,0 +1,140 @@
+# storage.py - Static file storage with precompressed variants and content-addressed media storage
+import gzip
+import hashlib
+import os
+import posixpath
+import re
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always produced
+    brotli = None
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Manifest storage that also writes .gz and .br copies during collectstatic"""
+
+    # Text formats worth compressing - fonts like woff/woff2 are already compressed
+    compressible_extensions = ('.css', '.js', '.svg', '.eot', '.ttf', '.json', '.txt', '.html', '.map')
+    # Below this size the encoded response is not worth the extra header
+    min_compress_size = 256
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+
+        if dry_run:
+            return
+
+        # Compress the final (hashed and unhashed) files once the manifest is written
+        for name in list(self.hashed_files.values()) + list(paths):
+            if name.endswith(self.compressible_extensions) and self.exists(name):
+                self.compress_file(name)
+
+    def compress_file(self, name):
+        """Write name.gz and name.br next to the file when they are smaller"""
+        path = self.path(name)
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        if len(data) < self.min_compress_size:
+            return
+
+        variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variants.append(('.br', brotli.compress(data, quality=11)))
+
+        for suffix, compressed in variants:
+            if len(compressed) < len(data):
+                with open(path + suffix, 'wb') as f:
+                    f.write(compressed)
+            elif os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Media storage that names files after the SHA-256 of their content.
+
+    An upload to "audio/song.mp3" is stored as "audio/ab/cd/abcd...ef.mp3", so
+    directories stay small however large the library grows, and identical
+    uploads share one file. MediaBlob counts the references; the file is only
+    removed when the last one is deleted.
+    """
+
+    chunk_size = 64 * 1024
+    shard_levels = 2  # Two levels of 256 directories each
+    name_pattern = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$')
+
+    def __init__(self, *args, **kwargs):
+        # The same content always maps to the same name, rewriting it is harmless
+        kwargs.setdefault('allow_overwrite', True)
+        super().__init__(*args, **kwargs)
+
+    def content_name(self, name, content):
+        """Hash the upload chunk by chunk and build its sharded name"""
+        digest = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for chunk in content.chunks(self.chunk_size):
+            digest.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+
+        hexdigest = digest.hexdigest()
+        directory = posixpath.dirname(name.replace('\\', '/'))
+        extension = os.path.splitext(name)[1].lower()[:10]
+        shards = [hexdigest[i * 2:i * 2 + 2] for i in range(self.shard_levels)]
+        return posixpath.join(directory, *shards, hexdigest + extension)
+
+    def is_content_addressed(self, name):
+        return bool(name and self.name_pattern.search(name))
+
+    def _save(self, name, content):
+        name = self.content_name(name, content)
+        created = self.add_references(name, size=content.size)
+
+        # Duplicate upload: the bytes are already on disk
+        if created or not self.exists(name):
+            super()._save(name, content)
+        return name
+
+    def add_references(self, name, count=1, size=None):
+        """Count `count` more users of a stored name; True when its MediaBlob was created"""
+        from .models import MediaBlob
+
+        if size is None:
+            size = self.size(name) if self.exists(name) else 0
+        with transaction.atomic():
+            blob, created = MediaBlob.objects.select_for_update().get_or_create(
+                name=name, defaults={'size': size, 'ref_count': count}
+            )
+            if not created:
+                MediaBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + count)
+        return created
+
+    def delete(self, name):
+        """Drop one reference; remove the file with the last one"""
+        from .caching import forget_media
+        from .models import MediaBlob
+
+        if not self.is_content_addressed(name):
+            # Files stored before this backend are not reference counted - keep them
+            return
+
+        with transaction.atomic():
+            updated = MediaBlob.objects.filter(name=name, ref_count__gt=1).update(ref_count=F('ref_count') - 1)
+            if updated:
+                return
+            deleted, _ = MediaBlob.objects.filter(name=name).delete()
+
+        if not deleted:
+            # Nobody counted the references (e.g. written outside a save): it may still be in use
+            print(f"Not deleting {name}: no MediaBlob counts its references")
+            return
+        super().delete(name)
+        forget_media(name)
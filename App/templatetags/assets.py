@@ -0,0 +1,30 @@
+# assets.py - Template tags for self-hosted third-party libraries
+from functools import lru_cache
+
+from django import template
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.templatetags.static import static
+
+register = template.Library()
+
+
+@lru_cache(maxsize=None)
+def is_vendored(path):
+    """True when the library has been copied into the static directories"""
+    return finders.find(path) is not None
+
+
+def missing_vendor_assets():
+    """Names from settings.VENDOR_ASSETS that have no local copy yet"""
+    return [name for name, asset in settings.VENDOR_ASSETS.items() if not is_vendored(asset['path'])]
+
+
+@register.simple_tag
+def vendor_asset(name):
+    """URL of the local copy of a library from settings.VENDOR_ASSETS"""
+    asset = settings.VENDOR_ASSETS[name]
+    if settings.DEBUG and not is_vendored(asset['path']):
+        # Development only (the system checks report it): production never loads a CDN
+        return asset['url']
+    return static(asset['path'])
@@ -1,3 +1,883 @@
-from django.test import TestCase
+# tests.py - Tests for media and static files, play tracking, lyrics lookups and the caches
+import io
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib import admin, messages
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import (alignment, caching, catalogue, jobs, lyrics_events, play_events, profiling, query_stats,
+               ratelimit, views)
+from .admin import SongAdmin
+from .models import LyricsEvent, MediaBlob, PlayEvent, Song, SongPlayStats
+from .query_stats import QueryStats
+from .ratelimit import TooManyLookups
+from .templatetags.assets import missing_vendor_assets
+
+
+class TemporaryMediaMixin:
+    """Media files go to a temporary MEDIA_ROOT, removed after each test"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def make_song(self, audio=b'audio bytes', title='Song'):
+        song = Song(title=title, artist='Artist', duration='3:00', image='covers/legacy.jpg')
+        song.audio_file.save('track.mp3', ContentFile(audio), save=False)
+        song.save()
+        return song
+
+    def blob(self, name):
+        return MediaBlob.objects.get(name=name)
+
+
+class MediaStorageTests(TemporaryMediaMixin, TestCase):
+    """Content-addressed media: identical uploads share a file, MediaBlob counts the references"""
+
+    def test_upload_is_stored_under_its_content_hash(self):
+        song = self.make_song()
+        self.assertRegex(song.audio_file.name, r'^audio/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.mp3$')
+        self.assertTrue(song.audio_file.storage.exists(song.audio_file.name))
+        self.assertEqual(self.blob(song.audio_file.name).ref_count, 1)
+
+    def test_identical_uploads_share_one_file(self):
+        first = self.make_song()
+        second = self.make_song(title='Copy')
+        self.assertEqual(first.audio_file.name, second.audio_file.name)
+        self.assertEqual(self.blob(first.audio_file.name).ref_count, 2)
+
+    def test_file_is_removed_with_the_last_reference(self):
+        first = self.make_song()
+        second = self.make_song(title='Copy')
+        name = first.audio_file.name
+        storage = first.audio_file.storage
+
+        first.delete()
+        self.assertTrue(storage.exists(name))
+        self.assertEqual(self.blob(name).ref_count, 1)
+
+        second.delete()
+        self.assertFalse(storage.exists(name))
+        self.assertFalse(MediaBlob.objects.filter(name=name).exists())
+
+    def test_replacing_media_releases_the_old_file(self):
+        song = self.make_song(b'first version')
+        old_name = song.audio_file.name
+
+        song.audio_file.save('track.mp3', ContentFile(b'second version'), save=False)
+        song.save()
+
+        self.assertNotEqual(song.audio_file.name, old_name)
+        self.assertFalse(song.audio_file.storage.exists(old_name))
+        self.assertFalse(MediaBlob.objects.filter(name=old_name).exists())
+        self.assertEqual(self.blob(song.audio_file.name).ref_count, 1)
+
+    def test_uploading_the_same_bytes_again_keeps_one_reference(self):
+        song = self.make_song()
+        self.make_song(title='Copy')
+        name = song.audio_file.name
+
+        song.audio_file = ContentFile(b'audio bytes', name='again.mp3')
+        song.save()
+
+        self.assertEqual(song.audio_file.name, name)
+        self.assertEqual(self.blob(name).ref_count, 2)
+
+    def test_saving_other_fields_does_not_touch_references(self):
+        song = self.make_song()
+        song.title = 'Renamed'
+        song.save()
+        song.save(update_fields=['title'])
+        self.assertEqual(self.blob(song.audio_file.name).ref_count, 1)
+
+    def test_files_without_a_content_hash_are_never_deleted(self):
+        song = self.make_song()
+        storage = song.audio_file.storage
+        os.makedirs(storage.path('covers'))
+        with open(storage.path('covers/legacy.jpg'), 'wb') as f:
+            f.write(b'cover stored before content addressing')
+
+        song.delete()
+        self.assertTrue(storage.exists('covers/legacy.jpg'))
+
+
+class CatalogueImportTests(TemporaryMediaMixin, TestCase):
+    """Bulk imports count the media references that save() signals would have counted"""
+
+    def import_records(self, *records):
+        with self.captureOnCommitCallbacks(execute=True):
+            return catalogue.import_ndjson(json.dumps(record) for record in records)
+
+    def record(self, **fields):
+        return dict({'title': 'Imported', 'artist': 'Artist', 'duration': '3:00', 'image': ''}, **fields)
+
+    def test_imported_songs_reference_shared_media(self):
+        song = self.make_song()
+        name = song.audio_file.name
+
+        self.import_records(self.record(audio_file=name), self.record(audio_file=name))
+        self.assertEqual(self.blob(name).ref_count, 3)
+
+        Song.objects.exclude(pk=song.pk).first().delete()
+        song.delete()
+        self.assertTrue(song.audio_file.storage.exists(name))
+        self.assertEqual(self.blob(name).ref_count, 1)
+
+    def test_import_releases_replaced_media(self):
+        first = self.make_song(b'first')
+        second = self.make_song(b'second', title='Other')
+        old_name = first.audio_file.name
+
+        self.import_records(self.record(id=first.pk, audio_file=second.audio_file.name))
+        self.assertFalse(first.audio_file.storage.exists(old_name))
+        self.assertEqual(self.blob(second.audio_file.name).ref_count, 2)
+
+    def test_reimporting_an_export_changes_nothing(self):
+        song = self.make_song()
+        records = [json.loads(line) for line in catalogue.iter_ndjson()]
+        self.assertEqual(self.import_records(*records), (0, 0, 0))
+        self.assertEqual(self.blob(song.audio_file.name).ref_count, 1)
+
+    def test_string_ids_update_existing_songs(self):
+        song = self.make_song()
+        result = self.import_records(self.record(id=str(song.pk), title='Renamed'),
+                                     self.record(id='five'), self.record(id=True), self.record(id=2 ** 63))
+        self.assertEqual(result, (0, 1, 3))
+        song.refresh_from_db()
+        self.assertEqual(song.title, 'Renamed')
+        self.assertEqual(Song.objects.count(), 1)
+
+    def test_lrc_archive_skips_lines_with_bad_times(self):
+        lyrics = [{'time': '1:', 'lyrics': 'Cut-off time'},
+                  {'time': '0:12', 'lyrics': 'Good line'},
+                  {'timestamp': 'soon', 'lyrics': 'Bad timestamp'},
+                  {'timestamp': 75.5, 'lyrics': 'Later line'}]
+        Song.objects.create(title='Timed', artist='Artist', duration='3:00', lyrics=json.dumps(lyrics))
+        Song.objects.create(title='Broken', artist='Artist', duration='3:00',
+                            lyrics=json.dumps([{'time': 'x:y', 'lyrics': 'Nothing valid'}]))
+
+        archive = tarfile.open(fileobj=io.BytesIO(b''.join(catalogue.iter_lrc_archive())), mode='r:gz')
+        [member] = archive.getmembers()
+        self.assertEqual(archive.extractfile(member).read().decode('utf-8'),
+                         '[ar:Artist]\n[ti:Timed]\n[00:12.00]Good line\n[01:15.50]Later line\n')
+
+    def test_file_without_a_blob_is_kept(self):
+        song = self.make_song()
+        name = song.audio_file.name
+        MediaBlob.objects.filter(name=name).delete()
+
+        song.delete()
+        self.assertTrue(song.audio_file.storage.exists(name))
+
+
+class MediaRangeTests(TemporaryMediaMixin, TestCase):
+    """serve_media answers Range requests with the requested bytes, streamed"""
+
+    content = bytes(range(256)) * 40
+
+    def setUp(self):
+        super().setUp()
+        with open(os.path.join(self.media_root, 'clip.mp3'), 'wb') as f:
+            f.write(self.content)
+
+    def get(self, byte_range):
+        response = self.client.get('/media/clip.mp3', HTTP_RANGE=byte_range)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_range_is_streamed(self):
+        response, body = self.get('bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response.streaming)
+        self.assertEqual(body, self.content[100:200])
+        self.assertEqual(response['Content-Length'], '100')
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.content)}')
+
+    def test_open_ended_range(self):
+        response, body = self.get('bytes=0-')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, self.content)
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+
+    def test_suffix_range(self):
+        response, body = self.get('bytes=-10')
+        self.assertEqual(body, self.content[-10:])
+
+    def test_unsatisfiable_range(self):
+        response, _ = self.get(f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+
+
+class LocalRateLimitsMixin:
+    """Token buckets live in a per-test in-memory cache, not the shared file cache"""
+
+    def setUp(self):
+        super().setUp()
+        settings_override = override_settings(CACHES=dict(settings.CACHES, ratelimit={
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-ratelimit'}))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        caches['ratelimit'].clear()
+
+
+class StaticFilesTests(TestCase):
+    """serve_static picks the precompressed variant the client accepts and caches hashed names for good"""
+
+    content = b'console.log("static");\n' * 40
+
+    def setUp(self):
+        self.static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.static_root, ignore_errors=True)
+        settings_override = override_settings(STATIC_ROOT=self.static_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        for name, data in (('app.0123456789ab.js', self.content),
+                           ('app.0123456789ab.js.gz', b'gzip bytes'),
+                           ('app.0123456789ab.js.br', b'brotli bytes'),
+                           ('plain.js', self.content)):
+            with open(os.path.join(self.static_root, name), 'wb') as f:
+                f.write(data)
+
+    def get(self, name, **headers):
+        response = self.client.get(f'/static/{name}', **headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_brotli_is_preferred(self):
+        response, body = self.get('app.0123456789ab.js', HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(body, b'brotli bytes')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+    def test_gzip_when_brotli_is_not_accepted(self):
+        response, body = self.get('app.0123456789ab.js', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(body, b'gzip bytes')
+
+    def test_refused_encodings_are_never_served(self):
+        response, body = self.get('app.0123456789ab.js', HTTP_ACCEPT_ENCODING='br;q=0, gzip;q=0.5')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+        response, body = self.get('app.0123456789ab.js', HTTP_ACCEPT_ENCODING='*;q=0, identity')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(body, self.content)
+
+        # "brotli" is not "br" - no substring matching
+        response, body = self.get('app.0123456789ab.js', HTTP_ACCEPT_ENCODING='brotli')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_wildcard_accepts_every_encoding(self):
+        response, _ = self.get('app.0123456789ab.js', HTTP_ACCEPT_ENCODING='*')
+        self.assertEqual(response['Content-Encoding'], 'br')
+
+    def test_unchanged_file_is_not_sent_again(self):
+        response, _ = self.get('app.0123456789ab.js', HTTP_ACCEPT_ENCODING='gzip')
+        etag = response['ETag']
+
+        response, body = self.get('app.0123456789ab.js', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(body, b'')
+
+        # The etag names the encoding, so the brotli copy is a different resource
+        response, _ = self.get('app.0123456789ab.js', HTTP_ACCEPT_ENCODING='br', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_only_hashed_names_are_immutable(self):
+        response, _ = self.get('app.0123456789ab.js')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+
+        response, _ = self.get('plain.js')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=300')
+
+    def test_missing_file(self):
+        response, _ = self.get('missing.js')
+        self.assertEqual(response.status_code, 404)
+
+
+class VendorAssetTests(TestCase):
+    """The player page never needs a CDN: every library is committed under App/static/vendor/"""
+
+    def test_every_library_is_vendored(self):
+        self.assertEqual(missing_vendor_assets(), [])
+
+    def test_player_page_renders_after_collectstatic(self):
+        static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, static_root, ignore_errors=True)
+
+        with override_settings(STATIC_ROOT=static_root, DEBUG=False):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            response = self.client.get('/')
+
+        self.assertEqual(response.status_code, 200)
+        html = response.content.decode()
+        self.assertRegex(html, r'/static/vendor/mediaelement/mediaelementplayer\.min\.[0-9a-f]{12}\.css')
+        self.assertNotIn('cdnjs', html)
+
+
+class LyricsEventStreamTests(TestCase):
+    """Streams end once every song has its lyrics and every ticket its outcome"""
+
+    def test_ticket_stream_ends_with_the_ticket_event(self):
+        since = lyrics_events.latest_event_id()
+        lyrics_events.publish('not_found', ticket='0123456789abcdef', message='Nothing')
+
+        started = time.monotonic()
+        chunks = list(lyrics_events.event_stream([], ['0123456789abcdef'], since))
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(len([chunk for chunk in chunks if chunk.startswith('id:')]), 1)
+        self.assertIn('"status": "not_found"', chunks[-1])
+
+    def stream(self, **params):
+        response = self.client.get('/lyrics-events/', params)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return [chunk.decode() for chunk in response.streaming_content]
+
+    def test_stored_lyrics_reach_the_song_stream(self):
+        song = Song.objects.create(title='Song', artist='Artist', duration='3:00')
+        since = lyrics_events.latest_event_id()
+        # Stored by anything but the page's own lookup - here a bulk update
+        lyrics_events.store_lyrics(song, [{'time': '00:01.00', 'text': 'hello'}])
+
+        started = time.monotonic()
+        chunks = self.stream(song=song.id, since=since)
+        self.assertLess(time.monotonic() - started, 1)
+        data = json.loads(chunks[-1].split('data: ', 1)[1])
+        self.assertEqual((data['status'], data['song_id']), ('ready', song.id))
+        self.assertEqual(data['lyrics'][0]['text'], 'hello')
+
+    @override_settings(LYRICS_STREAM_MAX_SECONDS=0.3)
+    def test_song_stream_outlives_a_failed_lookup(self):
+        song = Song.objects.create(title='Song', artist='Artist', duration='3:00')
+        since = lyrics_events.latest_event_id()
+        lyrics_events.publish('not_found', song_id=song.id, ticket='0123456789abcdef', message='Nothing')
+
+        started = time.monotonic()
+        chunks = self.stream(song=song.id, ticket='0123456789abcdef', since=since)
+        self.assertGreaterEqual(time.monotonic() - started, 0.3)
+        self.assertEqual(len([chunk for chunk in chunks if chunk.startswith('id:')]), 1)
+
+
+class FetchLyricsTests(LocalRateLimitsMixin, TestCase):
+    """fetch_lyrics answers with a ticket; the lookup's outcome is always published"""
+
+    def test_invalid_song_id_is_rejected(self):
+        response = self.client.post('/fetch-lyrics/', {'artist': 'Artist', 'title': 'Title', 'song_id': 'abc'},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.json()['success'])
+
+    def test_failed_lookup_publishes_an_error(self):
+        with mock.patch.object(lyrics_events, 'lookup_and_store', side_effect=RuntimeError('provider down')):
+            with self.assertRaises(RuntimeError):
+                lyrics_events.run_lookup('0123456789abcdef', 'Artist', 'Title')
+
+        event = LyricsEvent.objects.get(ticket='0123456789abcdef')
+        self.assertEqual(event.status, 'error')
+        self.assertIn('provider down', event.message)
+
+    def test_lookup_gives_up_when_no_provider_slot_frees_up(self):
+        busy = mock.patch.object(lyrics_events, 'lookup_slot', side_effect=TooManyLookups(retry_after=0))
+        with busy as lookup_slot, mock.patch('App.views.get_synced_lyrics') as get_synced_lyrics:
+            lyrics_events.run_lookup('0123456789abcdef', 'Artist', 'Title')
+
+        self.assertEqual(lookup_slot.call_count, lyrics_events.LOOKUP_SLOT_ATTEMPTS)
+        get_synced_lyrics.assert_not_called()
+        self.assertEqual(LyricsEvent.objects.get(ticket='0123456789abcdef').status, 'error')
+
+
+class RateLimitTests(LocalRateLimitsMixin, TestCase):
+    """Token buckets per client IP, seen through trusted proxies, and the provider lookup slots"""
+
+    def fetch(self, remote_addr='203.0.113.5', forwarded_for=None):
+        headers = {'REMOTE_ADDR': remote_addr}
+        if forwarded_for:
+            headers['HTTP_X_FORWARDED_FOR'] = forwarded_for
+        with mock.patch.object(lyrics_events, 'request_lookup'):
+            return self.client.post('/fetch-lyrics/', {'artist': 'Artist', 'title': 'Title'},
+                                    content_type='application/json', **headers)
+
+    @override_settings(RATE_LIMITS={'fetch_lyrics': {'capacity': 1, 'per_minute': 6}})
+    def test_empty_bucket_answers_429_with_retry_after(self):
+        self.assertEqual(self.fetch().status_code, 202)
+
+        response = self.fetch()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '10')
+        self.assertEqual(response.json()['retry_after'], 10)
+        self.assertFalse(response.json()['success'])
+
+    @override_settings(RATE_LIMITS={'fetch_lyrics': {'capacity': 1, 'per_minute': 6}},
+                       RATE_LIMIT_TRUSTED_PROXIES=['10.0.0.0/8'])
+    def test_clients_behind_a_trusted_proxy_have_their_own_buckets(self):
+        self.assertEqual(self.fetch('10.0.0.2', '198.51.100.1').status_code, 202)
+        self.assertEqual(self.fetch('10.0.0.2', '198.51.100.2').status_code, 202)
+        self.assertEqual(self.fetch('10.0.0.2', '198.51.100.1').status_code, 429)
+
+    @override_settings(RATE_LIMITS={'fetch_lyrics': {'capacity': 1, 'per_minute': 6}})
+    def test_forwarded_for_from_an_untrusted_address_is_ignored(self):
+        self.assertEqual(self.fetch(forwarded_for='198.51.100.1').status_code, 202)
+        self.assertEqual(self.fetch(forwarded_for='198.51.100.2').status_code, 429)
+
+    @override_settings(RATE_LIMIT_TRUSTED_PROXIES=['10.0.0.2', '10.0.1.0/24'])
+    def test_client_ip_skips_only_trusted_hops(self):
+        request = RequestFactory().get('/', REMOTE_ADDR='10.0.0.2',
+                                       HTTP_X_FORWARDED_FOR='192.0.2.9, 198.51.100.1, 10.0.1.7')
+        # 192.0.2.9 was sent by the client itself and cannot be trusted
+        self.assertEqual(ratelimit.client_ip(request), '198.51.100.1')
+
+    def test_lookup_slots_are_capped(self):
+        lock_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, lock_dir, ignore_errors=True)
+
+        with override_settings(MAX_CONCURRENT_LOOKUPS=1, RATE_LIMIT_LOCK_DIR=lock_dir):
+            with ratelimit.lookup_slot():
+                with self.assertRaises(TooManyLookups):
+                    with ratelimit.lookup_slot():
+                        pass
+            # Released on exit
+            with ratelimit.lookup_slot():
+                pass
+
+
+class JobPoolTests(TestCase):
+    """Job key prefixes listed in BACKGROUND_JOB_POOLS run on their own threads"""
+
+    @override_settings(BACKGROUND_JOB_POOLS={'lookup': 1})
+    def test_lookups_run_on_their_own_pool(self):
+        release = threading.Event()
+        names = {}
+
+        def record(kind):
+            names[kind] = threading.current_thread().name
+            if kind == 'lookup':
+                release.wait(5)
+
+        blocked = jobs.submit('lookup:test-pool', record, 'lookup')
+        jobs.submit('align:test-pool', record, 'align').result(timeout=5)
+        release.set()
+        blocked.result(timeout=5)
+
+        self.assertTrue(names['lookup'].startswith('melophile-lookup'))
+        self.assertTrue(names['align'].startswith('melophile-job'))
+
+
+def tone_bursts(seconds, starts, length=2.0):
+    """Silent track with a 440 Hz tone of `length` seconds at each start"""
+    rate = alignment.SAMPLE_RATE
+    times = alignment.np.arange(int(seconds * rate)) / rate
+    samples = alignment.np.zeros(len(times), dtype=alignment.np.float32)
+    for start in starts:
+        burst = (times >= start) & (times < start + length)
+        samples[burst] = 0.5 * alignment.np.sin(2 * alignment.np.pi * 440 * times[burst])
+    return samples
+
+
+@skipIf(alignment.np is None, "numpy not installed")
+class AlignmentTests(SimpleTestCase):
+    """Plain lyric lines land on the sung parts of the track, in order"""
+
+    def test_lines_start_on_the_bursts(self):
+        bursts = [5, 12, 20, 27]
+        starts = alignment.align_lines(['la la la'] * 4, tone_bursts(32, bursts))
+        for start, burst in zip(starts, bursts):
+            self.assertAlmostEqual(start, burst, delta=0.1)
+        self.assertTrue(all(a < b for a, b in zip(starts, starts[1:])))
+
+    def test_single_line_starts_with_the_singing(self):
+        starts = alignment.align_lines(['only line'], tone_bursts(32, [5, 12, 20, 27]))
+        self.assertEqual(len(starts), 1)
+        self.assertAlmostEqual(starts[0], 5, delta=0.1)
+
+    def test_silent_track_spreads_lines_evenly(self):
+        samples = alignment.np.zeros(10 * alignment.SAMPLE_RATE, dtype=alignment.np.float32)
+        starts = alignment.align_lines(['one', 'two', 'six'], samples)
+        self.assertEqual(starts[0], 0)
+        self.assertTrue(all(a < b for a, b in zip(starts, starts[1:])))
+        self.assertLess(starts[-1], 10)
+
+    def test_full_track_aligns_quickly(self):
+        bursts = list(range(10, 230, 4))
+        samples = tone_bursts(240, bursts)
+        started = time.perf_counter()
+        starts = alignment.align_lines(['a lyric line'] * len(bursts), samples)
+        self.assertLess(time.perf_counter() - started, 1.0)
+        self.assertEqual(len(starts), len(bursts))
+
+    def test_aligned_text_keeps_the_lyrics_json_shape(self):
+        aligned = alignment.align_lyrics_text('first\n\n  second  \n', tone_bursts(20, [3, 10.5]))
+        self.assertEqual([line['lyrics'] for line in aligned], ['first', 'second'])
+        self.assertEqual(aligned[1]['time'], '0:10')
+        self.assertEqual(alignment.align_lyrics_text('  \n ', tone_bursts(5, [])), [])
+
+
+class PlainTextLyricsTests(SimpleTestCase):
+    """Only lyrics without any timing are queued for alignment"""
+
+    def check(self, lyrics, expected):
+        self.assertIs(Song(lyrics=lyrics).has_plain_text_lyrics(), expected, lyrics)
+
+    def test_plain_text(self):
+        self.check('First line\nSecond line', True)
+        self.check('[Chorus]\nSing along', True)
+
+    def test_timed_or_empty(self):
+        self.check('', False)
+        self.check('   \n', False)
+        self.check('[00:12.30]First line\n[00:15.00]Second line', False)
+        self.check('[ar:Artist]\n[00:12]First line', False)
+        self.check('[{"time": "0:12", "timestamp": 12.0, "lyrics": "First line"}]', False)
+
+
+class ProfilingTests(TestCase):
+    """Profiled requests never run two cProfile sessions at once"""
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir, ignore_errors=True)
+
+    def middleware(self):
+        with override_settings(PROFILING_ENABLED=True, PROFILING_DIR=self.output_dir):
+            return profiling.ProfilingMiddleware(lambda request: HttpResponse('ok'))
+
+    def test_request_is_sampled_while_another_is_cprofiled(self):
+        middleware = self.middleware()
+        request = RequestFactory().get('/')
+        request.resolver_match = None
+
+        with profiling._cprofile_lock:
+            response = middleware.profile(request, 'cprofile')
+
+        self.assertEqual(response.status_code, 200)
+        files = os.listdir(self.output_dir)
+        self.assertTrue(any(name.endswith('.collapsed') for name in files))
+        self.assertFalse(any(name.endswith('.prof') for name in files))
+
+    def test_cprofile_lock_is_released(self):
+        request = RequestFactory().get('/')
+        request.resolver_match = None
+        self.middleware().profile(request, 'cprofile')
+        self.assertFalse(profiling._cprofile_lock.locked())
+        self.assertTrue(any(name.endswith('.prof') for name in os.listdir(self.output_dir)))
+
+    def test_log_leaves_out_the_token_and_session_data(self):
+        token = profiling.make_token('sample')
+        request = RequestFactory().get('/', {'page': '2', 'profile': token})
+        request.resolver_match = None
+
+        def view(request):
+            Song.objects.filter(title='needle').exists()
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT session_data FROM django_session WHERE session_key = %s', ['secret-key'])
+            return HttpResponse('ok')
+
+        with override_settings(PROFILING_ENABLED=True, PROFILING_DIR=self.output_dir):
+            profiling.ProfilingMiddleware(view).profile(request, 'sample')
+
+        [name] = [name for name in os.listdir(self.output_dir) if name.endswith('.sql.json')]
+        with open(os.path.join(self.output_dir, name), encoding='utf-8') as f:
+            summary = json.load(f)
+        self.assertEqual(summary['path'], '/?page=2')
+        params = [query['params'] for query in summary['queries']]
+        self.assertTrue(any('needle' in value for value in params))
+        self.assertIn('<redacted>', params)
+        self.assertNotIn('secret-key', json.dumps(summary))
+
+
+class QueryStatsTests(SimpleTestCase):
+    """Query variant counts are written in batches, keep a bounded artist table and count every miss"""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = os.path.join(directory, 'stats.json')
+
+    def test_saves_are_batched(self):
+        stats = QueryStats(self.path)
+        for _ in range(query_stats.SAVE_EVERY_LOOKUPS - 1):
+            stats.record('artist_title', 'Artist', 'Title', True)
+            stats.record_lookup(1, True)
+            self.assertFalse(stats.save_if_due())
+        self.assertFalse(os.path.exists(self.path))
+
+        stats.record_lookup(1, True)
+        self.assertTrue(stats.save_if_due())
+        self.assertEqual(QueryStats(self.path).summary()['lookups']['count'], query_stats.SAVE_EVERY_LOOKUPS)
+
+    def test_artist_table_is_capped(self):
+        stats = QueryStats(self.path, max_artists=2)
+        for artist, tries in (('often', 3), ('rarely', 1), ('sometimes', 2)):
+            for _ in range(tries):
+                stats.record('artist_title', artist, 'Title', False)
+        stats.save()
+
+        with open(self.path, encoding='utf-8') as f:
+            self.assertEqual(set(json.load(f)['artist']), {'often', 'sometimes'})
+
+    def test_only_synced_results_are_hits(self):
+        self.assertTrue(query_stats.is_hit('[00:12.30]Short line'))
+        self.assertFalse(query_stats.is_hit('Plain lyrics without any timing ' * 5))
+        self.assertFalse(query_stats.is_hit(None))
+
+    def test_provider_errors_count_as_misses(self):
+        stats = QueryStats(self.path)
+        results = {'Artist Title': RuntimeError('provider down'), 'Title Artist': 'Plain text ' * 20,
+                   'Artist - Title': '[00:01.00]Found it'}
+
+        def search(query):
+            result = results.get(query)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        with mock.patch('App.views.get_lyrics_search', return_value=search), \
+                mock.patch('App.views.get_query_stats', return_value=stats), \
+                mock.patch.object(QueryStats, 'order', lambda self, variants, artist, title: list(variants)):
+            lyrics = views.get_synced_lyrics('Artist', 'Title')
+
+        self.assertEqual(lyrics[0]['lyrics'], 'Found it')
+        variants = stats.summary()['variants']
+        self.assertEqual(variants['artist_title'], (0, 1))
+        self.assertEqual(variants['title_artist'], (0, 1))
+        self.assertEqual(variants['artist_dash_title'], (1, 1))
+        self.assertEqual(stats.summary()['lookups']['found'], 1)
+
+
+# Pages render without running collectstatic first
+PLAIN_STATIC_STORAGES = dict(settings.STORAGES, staticfiles={
+    'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'})
+
+
+@override_settings(CACHE_INDEX_PAGES=False, STORAGES=PLAIN_STATIC_STORAGES)
+class PreloadLinkTests(TestCase):
+    """The player page hints the next track's page and cover, found without OFFSET scans"""
+
+    def setUp(self):
+        self.songs = [Song.objects.create(title=f'Song {number}', artist='Artist', duration='3:00',
+                                          image=f'covers/{number}.jpg', audio_file=f'audio/{number}.mp3')
+                      for number in range(1, 4)]
+
+    def links(self, page):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/', {'page': page})
+        self.assertEqual(response.status_code, 200)
+        offsets = [query['sql'] for query in queries.captured_queries if 'OFFSET' in query['sql']]
+        # Only the paginator's own page query may skip rows
+        self.assertLessEqual(len(offsets), 1, offsets)
+        return [link.strip() for link in response.get('Link', '').split(',') if link.strip()]
+
+    def test_middle_page_hints_the_next_track_only(self):
+        self.assertEqual(self.links(2), [
+            '</media/covers/2.jpg>; rel=preload; as=image',
+            '<?page=3>; rel=prefetch; as=document',
+            '</media/covers/3.jpg>; rel=prefetch; as=image',
+        ])
+
+    def test_next_track_follows_id_order_across_gaps(self):
+        self.songs[1].delete()
+        self.assertIn('</media/covers/3.jpg>; rel=prefetch; as=image', self.links(1))
+
+    def test_last_page_hints_nothing_ahead(self):
+        self.assertEqual(self.links(3), ['</media/covers/3.jpg>; rel=preload; as=image'])
+
+
+@override_settings(CACHE_INDEX_PAGES=True, STORAGES=PLAIN_STATIC_STORAGES)
+class WarmCacheTests(TestCase):
+    """Requests read the shared cache but never write it - only warm_caches does"""
+
+    def setUp(self):
+        for title in ('One', 'Two'):
+            Song.objects.create(title=title, artist='Artist', duration='3:00', image='covers/x.jpg',
+                                audio_file='audio/x.mp3', lyrics='plain line\nanother line')
+
+    def shared_entries(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM melophile_warm_cache')
+            return cursor.fetchone()[0]
+
+    def test_page_views_do_not_write_the_shared_cache(self):
+        before = self.shared_entries()
+        for page in ('1', '2', '99999', '0'):
+            self.assertEqual(self.client.get('/', {'page': page}).status_code, 200)
+        self.assertEqual(self.shared_entries(), before)
+
+    def test_warmed_page_is_served_whatever_the_number_looks_like(self):
+        caching.cache().set(caching.index_page_key(1), ('<p>warmed</p>', ''), None)
+        self.assertEqual(self.client.get('/', {'page': '001'}).content, b'<p>warmed</p>')
+
+    def warm_pages(self, count):
+        for number in range(1, count + 1):
+            caching.cache().set(caching.index_page_key(number), (f'<p>page {number}</p>', ''), None)
+
+    def warmed_pages(self, count):
+        return [number for number in range(1, count + 1) if caching.get_index_page(number)]
+
+    def test_adding_a_song_keeps_the_earlier_pages(self):
+        self.warm_pages(2)
+        Song.objects.create(title='Three', artist='Artist', duration='3:00')
+        # Page 2 gains a next track; page 1 is untouched
+        self.assertEqual(self.warmed_pages(3), [1])
+
+    def test_removing_the_last_song_keeps_the_earlier_pages(self):
+        last = Song.objects.create(title='Three', artist='Artist', duration='3:00')
+        self.warm_pages(3)
+        last.delete()
+        self.assertEqual(self.warmed_pages(3), [1])
+
+    def test_removing_a_song_mid_list_drops_every_page(self):
+        self.warm_pages(2)
+        Song.objects.order_by('id').first().delete()
+        self.assertEqual(self.warmed_pages(2), [])
+
+    def test_lyrics_computed_on_request_stay_in_process(self):
+        song = Song.objects.first()
+        before = self.shared_entries()
+        self.assertEqual(song.get_formatted_lyrics(), song.get_formatted_lyrics())
+        self.assertEqual(self.shared_entries(), before)
+        self.assertIsNotNone(caching.local_cache().get(caching.lyrics_key(song)))
+
+
+class SongAdminTests(TestCase):
+    """Admin search and the fetch-lyrics action"""
+
+    @override_settings(MAX_PENDING_LOOKUPS=2)
+    def test_action_respects_the_pending_cap(self):
+        for number in range(5):
+            Song.objects.create(title=f'Song {number}', artist='Artist', duration='3:00')
+        model_admin = SongAdmin(Song, admin.site)
+
+        with mock.patch.object(lyrics_events, 'request_lookup') as request_lookup, \
+                mock.patch.object(model_admin, 'message_user') as message_user:
+            model_admin.fetch_lyrics(RequestFactory().post('/'), Song.objects.all())
+
+        self.assertEqual(request_lookup.call_count, 2)
+        message, level = message_user.call_args.args[1:]
+        self.assertEqual(level, messages.WARNING)
+        self.assertIn('Skipped 3 songs', message)
+
+    def test_search_matches_accented_names(self):
+        song = Song.objects.create(title='Hymne', artist='Édith Piaf', duration='3:00')
+        Song.objects.create(title='Other', artist='Edith', duration='3:00')
+        model_admin = SongAdmin(Song, admin.site)
+
+        for term in ('Édith', 'ÉDITH P'):
+            results, _ = model_admin.get_search_results(None, Song.objects.all(), term)
+            self.assertEqual(list(results), [song], term)
+
+
+class PlayTrackingTests(LocalRateLimitsMixin, TestCase):
+    """Malformed play events and chart limits are answered, not turned into 500s"""
+
+    def post_event(self, body):
+        return self.client.post('/play-event/', body, content_type='application/json')
+
+    def test_event_must_be_an_object(self):
+        self.assertEqual(self.post_event('[1, 2]').status_code, 400)
+        self.assertEqual(self.post_event('"play"').status_code, 400)
+
+    def test_numbers_the_database_cannot_store_are_rejected(self):
+        bodies = [
+            '{"song_id": 1, "event": "play", "position": NaN}',
+            '{"song_id": 1, "event": "play", "position": Infinity}',
+            '{"song_id": 1, "event": "play", "position": -1}',
+            '{"song_id": 1, "event": "play", "position": true}',
+            '{"song_id": 99999999999999999999999, "event": "play"}',
+            '{"song_id": 1e400, "event": "play"}',
+            '{"song_id": 0, "event": "play"}',
+            '{"song_id": true, "event": "play"}',
+        ]
+        with mock.patch.object(play_events.buffer, 'add') as add:
+            for body in bodies:
+                self.assertEqual(self.post_event(body).status_code, 400, body)
+        add.assert_not_called()
+
+    @override_settings(RATE_LIMITS={'play_event': {'capacity': 2, 'per_minute': 1}})
+    def test_events_are_rate_limited(self):
+        body = json.dumps({'song_id': 1, 'event': 'pause', 'position': 3})
+        with mock.patch.object(play_events.buffer, 'add'):
+            statuses = [self.post_event(body).status_code for _ in range(3)]
+        self.assertEqual(statuses, [202, 202, 429])
+
+    def test_valid_event_is_buffered(self):
+        with mock.patch.object(play_events.buffer, 'add') as add:
+            response = self.post_event(json.dumps({'song_id': 1, 'event': 'play', 'position': 3}))
+        self.assertEqual(response.status_code, 202)
+        add.assert_called_once()
+
+    def test_charts_limit_is_clamped(self):
+        for limit in ('-1', '0', '1000', 'many'):
+            self.assertEqual(self.client.get('/charts/', {'limit': limit}).status_code, 200)
+
+
+class PlayStatsTests(TestCase):
+    """Buffered events roll up into SongPlayStats; a bad event never costs the rest of its batch"""
+
+    def setUp(self):
+        self.song = Song.objects.create(title='Song', artist='Artist', duration='3:00')
+        self.buffer = play_events.PlayEventBuffer(max_size=1000, flush_interval=3600)
+
+    def event(self, event, position, minutes_ago=0, song_id=None):
+        return PlayEvent(song_id=song_id or self.song.id, event=event, position=position,
+                         created_at=timezone.now() - timedelta(minutes=minutes_ago))
+
+    def stats(self):
+        return SongPlayStats.objects.get(song=self.song)
+
+    def test_only_plays_from_the_start_are_counted(self):
+        first, resumed, second = (self.event('play', 0, minutes_ago=10), self.event('play', 95, minutes_ago=5),
+                                  self.event('play', play_events.PLAY_START_WINDOW - 1, minutes_ago=1))
+        play_events.write_events([first, self.event('pause', 95, minutes_ago=6), resumed, second,
+                                  self.event('ended', 180)])
+
+        self.assertEqual(self.stats().play_count, 2)
+        self.assertEqual(self.stats().last_played_at, second.created_at)
+        self.assertEqual(PlayEvent.objects.count(), 5)
+
+    def test_last_played_never_goes_back(self):
+        recent = self.event('play', 0)
+        play_events.write_events([recent])
+        play_events.write_events([self.event('play', 0, minutes_ago=60)])
+
+        self.assertEqual(self.stats().play_count, 2)
+        self.assertEqual(self.stats().last_played_at, recent.created_at)
+
+    def test_events_for_deleted_songs_are_dropped(self):
+        play_events.write_events([self.event('play', 0, song_id=self.song.id + 1000)])
+        self.assertFalse(PlayEvent.objects.exists())
+
+    def test_a_bad_event_does_not_lose_the_batch(self):
+        self.buffer.add(self.song.id, 'play', 0)
+        self.buffer.add(self.song.id, 'play', float('nan'))
+        self.buffer.add(self.song.id, 'pause', 30)
+
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(PlayEvent.objects.count(), 2)
+        self.assertEqual(self.stats().play_count, 1)
+
+    def test_events_are_kept_while_the_database_is_unavailable(self):
+        self.buffer.add(self.song.id, 'play', 0)
+        with mock.patch.object(play_events, 'write_events', side_effect=OperationalError('database is locked')):
+            self.assertEqual(self.buffer.flush(), 0)
+
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(self.stats().play_count, 1)
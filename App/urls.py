@@ -9,4 +9,8 @@ app_name = "App"
 urlpatterns = [
     path("", views.index, name="index"),
     path("fetch-lyrics/", views.fetch_lyrics, name="fetch_lyrics"),  # New endpoint
+    path("lyrics-events/", views.lyrics_stream, name="lyrics_stream"),
+    path("play-event/", views.play_event, name="play_event"),
+    path("charts/", views.charts, name="charts"),
+    path("catalogue/export/", views.export_catalogue, name="export_catalogue"),
 ]
\ No newline at end of file
@@ -1,29 +1,104 @@
 # views.py - Complete updated version with lyrics functionality
-from django.shortcuts import render, redirect
+from django.template.loader import render_to_string
 from django.core.paginator import Paginator
-from django.http import JsonResponse
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.http import JsonResponse, FileResponse, Http404, HttpResponseNotModified, HttpResponse, StreamingHttpResponse
+from django.utils.module_loading import import_string
+from django.utils._os import safe_join
+from django.utils.http import http_date
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
+from django.views.static import was_modified_since
+import atexit
 import json
+import math
+import mimetypes
+import os
+import posixpath
 import re
-import requests
-from .models import Song
+
+try:
+    import syncedlyrics
+except ImportError:  # get_synced_lyrics reports it on the first lookup
+    syncedlyrics = None
+
+from .models import MAX_SONG_ID, Song, PlayEvent
+from . import caching, catalogue, lyrics_events, play_events
+from .query_stats import QueryStats, build_query, is_hit
+from .ratelimit import rate_limited, too_many_requests
 
 def index(request):
     """Main view to display songs with pagination"""
-    paginator = Paginator(Song.objects.all(), 1)
-    page_number = request.GET.get('page')
+    page_number = request.GET.get('page') or '1'
+    # Plain page views are served from the shared cache. Only manage.py warm_caches
+    # writes it: a miss is rendered, never stored, so no request adds cache entries.
+    cacheable = (getattr(settings, 'CACHE_INDEX_PAGES', False) and
+                 set(request.GET) <= {'page'} and page_number.isdigit())
+    
+    cached = caching.get_index_page(page_number) if cacheable else None
+    if cached:
+        html, link_header = cached
+    else:
+        html, link_header = render_index_page(request, page_number)
+    
+    response = HttpResponse(html)
+    if link_header:
+        response['Link'] = link_header
+    return response
+
+def render_index_page(request, page_number):
+    """Render the player page for one song; returns (html, Link header value)"""
+    # Stable ordering so neighbouring pages always agree on which song comes next
+    songs = Song.objects.order_by('id')
+    paginator = Paginator(songs, 1)
     page_obj = paginator.get_page(page_number)
     
     # Add formatted lyrics to each song object
     for song in page_obj:
         song.formatted_lyrics = song.get_formatted_lyrics()
     
-    context = {"page_obj": page_obj}
-    return render(request, "index.html", context)
+    # Work out the next track so the browser can warm it up
+    next_song = get_next_song(songs, page_obj) if page_obj.has_next() else None
+    
+    context = {
+        "page_obj": page_obj,
+        "next_song": next_song,
+    }
+    html = render_to_string("index.html", context, request=request)
+    return html, build_preload_links(page_obj, next_song)
+
+def get_next_song(songs, page_obj):
+    """Return the song shown on the page after `page_obj`"""
+    current = page_obj[-1]
+    # Seek by id rather than OFFSET, which gets slower the further into the library;
+    # only the fields needed for the hints - lyrics can be large
+    return (songs.filter(id__gt=current.id)
+            .only('id', 'title', 'artist', 'image', 'audio_file', 'audio_link')
+            .first())
+
+def build_preload_links(page_obj, next_song):
+    """Build the Link header value with preload/prefetch hints for track changes"""
+    links = []
+    
+    # Current track: start fetching the cover straight away
+    for song in page_obj:
+        if song.image:
+            links.append(f'<{song.image.url}>; rel=preload; as=image')
+    
+    # Next track: its page (which carries the lyrics) and cover. Not the audio: a prefetch
+    # downloads the whole file, even for listeners who never press play - the player
+    # fetches its metadata on play and buffers it close to the end of the current track.
+    if next_song:
+        links.append(f'<?page={page_obj.next_page_number()}>; rel=prefetch; as=document')
+        if next_song.image:
+            links.append(f'<{next_song.image.url}>; rel=prefetch; as=image')
+    
+    return ', '.join(links)
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@rate_limited('fetch_lyrics')
 def fetch_lyrics(request):
     """AJAX endpoint to fetch synced lyrics for a song"""
     try:
@@ -38,34 +113,29 @@ def fetch_lyrics(request):
                 'message': 'Artist and title are required'
             })
         
+        if song_id is not None:
+            try:
+                song_id = int(song_id)
+            except (TypeError, ValueError):
+                return JsonResponse({'success': False, 'message': 'Invalid song_id'}, status=400)
+        
         print(f"Fetching lyrics for: {artist} - {title}")
         
-        # Try to fetch synced lyrics
-        lyrics_data = get_synced_lyrics(artist, title)
+        # Answer right away; the result arrives on the lyrics-events stream
+        ticket = lyrics_events.make_ticket(artist, title, song_id)
+        since = lyrics_events.latest_event_id()
+        if not lyrics_events.lookup_in_progress(ticket):
+            if lyrics_events.pending_lookups() >= getattr(settings, 'MAX_PENDING_LOOKUPS', 50):
+                return too_many_requests(5, 'Lyrics service is busy, please try again shortly')
+            lyrics_events.request_lookup(artist, title, song_id)
         
-        if lyrics_data and len(lyrics_data) > 0:
-            # Save to database if song_id provided
-            if song_id:
-                try:
-                    song = Song.objects.get(id=song_id)
-                    song.lyrics = json.dumps(lyrics_data, ensure_ascii=False)
-                    song.save()
-                    print(f"Lyrics saved to database for song ID: {song_id}")
-                except Song.DoesNotExist:
-                    print(f"Song with ID {song_id} not found")
-                except Exception as e:
-                    print(f"Error saving lyrics: {e}")
-            
-            return JsonResponse({
-                'success': True,
-                'lyrics': lyrics_data,
-                'message': f'Found {len(lyrics_data)} synced lyric lines'
-            })
-        else:
-            return JsonResponse({
-                'success': False,
-                'message': 'No synced lyrics found for this song. Try checking the spelling or try a different song.'
-            })
+        return JsonResponse({
+            'success': True,
+            'pending': True,
+            'ticket': ticket,
+            'since': since,
+            'message': 'Looking for synced lyrics...'
+        }, status=202)
             
     except json.JSONDecodeError:
         return JsonResponse({
@@ -79,31 +149,145 @@ def fetch_lyrics(request):
             'message': f'Error fetching lyrics: {str(e)}'
         })
 
+@require_http_methods(["GET"])
+def lyrics_stream(request):
+    """Server-Sent Events stream announcing stored lyrics for ?song= ids and/or ?ticket= lookups"""
+    song_ids = [int(value) for value in request.GET.getlist('song') if value.isdigit()]
+    tickets = [value for value in request.GET.getlist('ticket') if re.fullmatch(r'[0-9a-f]{16}', value)]
+    if not song_ids and not tickets:
+        return JsonResponse({'success': False, 'message': 'song or ticket is required'}, status=400)
+
+    # EventSource resends the last id it saw when it reconnects
+    last_id = request.headers.get('Last-Event-ID') or request.GET.get('since') or ''
+    last_id = int(last_id) if last_id.isdigit() else lyrics_events.latest_event_id()
+
+    response = StreamingHttpResponse(
+        lyrics_events.event_stream(song_ids, tickets, last_id),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Do not let nginx buffer the stream
+    return response
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@rate_limited('play_event')
+def play_event(request):
+    """Beacon endpoint for the player's play/pause/ended events (buffered, not written inline)"""
+    try:
+        data = json.loads(request.body)
+        if not isinstance(data, dict):
+            raise ValueError('Expected a JSON object')
+        song_id = data.get('song_id')
+        position = data.get('position') or 0
+        # bool is an int subclass - "true" is not an id or a position
+        if isinstance(song_id, bool) or isinstance(position, bool):
+            raise ValueError('Expected numbers')
+        song_id = int(song_id)
+        position = float(position)
+        if not 1 <= song_id <= MAX_SONG_ID:
+            raise ValueError(f'song_id out of range: {song_id}')
+        # NaN/inf would be accepted here and only fail at the next flush
+        if not math.isfinite(position) or position < 0:
+            raise ValueError(f'Invalid position: {position}')
+        event = data.get('event')
+    except (json.JSONDecodeError, TypeError, ValueError, OverflowError):
+        return JsonResponse({'success': False, 'message': 'Invalid event data'}, status=400)
+    
+    if event not in dict(PlayEvent.EVENT_CHOICES):
+        return JsonResponse({'success': False, 'message': f'Unknown event: {event}'}, status=400)
+    
+    play_events.buffer.add(song_id, event, position, request.session.session_key)
+    return JsonResponse({'success': True}, status=202)
+
+def charts(request):
+    """Most played and recently played songs from the precomputed aggregates"""
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 10)), 100))
+    except ValueError:
+        limit = 10
+    
+    def serialize(stats):
+        return {
+            'song_id': stats.song.id,
+            'title': stats.song.title,
+            'artist': stats.song.artist,
+            'play_count': stats.play_count,
+            'last_played_at': stats.last_played_at.isoformat() if stats.last_played_at else None,
+        }
+    
+    return JsonResponse({
+        'success': True,
+        'most_played': [serialize(s) for s in play_events.most_played(limit)],
+        'recently_played': [serialize(s) for s in play_events.recently_played(limit)],
+    })
+
+def get_lyrics_search():
+    """The provider's search(query) function - syncedlyrics unless settings.LYRICS_PROVIDER overrides it"""
+    provider = getattr(settings, 'LYRICS_PROVIDER', None)
+    if provider:
+        return import_string(provider)
+    if syncedlyrics is None:
+        raise ImportError("syncedlyrics is not installed")
+    return syncedlyrics.search
+
+# Variants get_synced_lyrics may try, reordered per song by query_stats
+LOOKUP_VARIANTS = ('artist_title', 'title_artist', 'artist_dash_title', 'title')
+_query_stats = None
+
+def get_query_stats():
+    global _query_stats
+    if _query_stats is None:
+        _query_stats = QueryStats(
+            getattr(settings, 'LYRICS_QUERY_STATS_FILE', os.path.join(settings.BASE_DIR, '.cache', 'lyrics_query_stats.json')),
+            by_artist=getattr(settings, 'LYRICS_QUERY_STATS_BY_ARTIST', True),
+        )
+        atexit.register(save_query_stats)
+    return _query_stats
+
+def save_query_stats():
+    """Write the counts not saved yet (at exit, and when gunicorn stops a worker)"""
+    if _query_stats is None:
+        return
+    try:
+        _query_stats.save()
+    except OSError as e:
+        print(f"Could not save lyric query stats: {e}")
+
 def get_synced_lyrics(artist, title):
     """Fetch synced lyrics using syncedlyrics library"""
     try:
-        import syncedlyrics
-        
-        # Try different query variations for better results
-        queries = [
-            f"{artist} {title}",
-            f"{title} {artist}",
-            f"{artist} - {title}",
-            title  # Sometimes just the title works better
-        ]
+        search = get_lyrics_search()
+        stats = get_query_stats()
         
+        # Try the query variations that worked best so far first
         lrc_lyrics = None
-        for query in queries:
+        found = False
+        calls = 0
+        for variant in stats.order(LOOKUP_VARIANTS, artist, title):
+            query = build_query(variant, artist, title)
             print(f"Trying query: {query}")
             try:
-                lrc_lyrics = syncedlyrics.search(query)
-                if lrc_lyrics and len(lrc_lyrics.strip()) > 100:  # Ensure we got substantial lyrics
+                calls += 1
+                lrc_lyrics = search(query)
+                found = is_hit(lrc_lyrics)
+                stats.record(variant, artist, title, found)
+                if found:
                     print(f"Success with query: {query}")
                     break
             except Exception as e:
                 print(f"Query '{query}' failed: {e}")
+                # A provider error is a miss too, or failing variants would never be skipped
+                stats.record(variant, artist, title, False)
                 continue
         
+        stats.record_lookup(calls, found)
+        try:
+            # Written in batches: every lookup re-reading and rewriting the file is too much
+            stats.save_if_due()
+        except OSError as e:
+            print(f"Could not save lyric query stats: {e}")
+        
         if lrc_lyrics:
             print(f"Raw LRC data length: {len(lrc_lyrics)} characters")
             return convert_lrc_to_json(lrc_lyrics)
@@ -189,8 +373,7 @@ def update_song_lyrics(request, song_id):
             lyrics_data = get_synced_lyrics(song.artist, song.title)
             
             if lyrics_data:
-                song.lyrics = json.dumps(lyrics_data, ensure_ascii=False)
-                song.save()
+                lyrics_events.store_lyrics(song, lyrics_data)
                 return JsonResponse({
                     'success': True,
                     'message': f'Updated lyrics for "{song.title}" by {song.artist}',
@@ -229,8 +412,7 @@ def bulk_update_lyrics(request):
         try:
             lyrics_data = get_synced_lyrics(song.artist, song.title)
             if lyrics_data:
-                song.lyrics = json.dumps(lyrics_data, ensure_ascii=False)
-                song.save()
+                lyrics_events.store_lyrics(song, lyrics_data)
                 updated_count += 1
                 print(f"Updated: {song.artist} - {song.title}")
             else:
@@ -243,4 +425,181 @@ def bulk_update_lyrics(request):
         'updated_count': updated_count,
         'total_songs': songs_without_lyrics.count(),
         'failed_songs': failed_songs[:10]  # Limit to first 10 failures
-    })
\ No newline at end of file
+    })
+
+# Streaming catalogue export (admin only)
+@require_http_methods(["GET"])
+def export_catalogue(request):
+    """Download every song as NDJSON (?format=ndjson) or the lyrics as an LRC archive (?format=lrc)"""
+    if not request.user.is_staff:
+        return JsonResponse({'success': False, 'message': 'Admin access required'}, status=403)
+    
+    export_format = request.GET.get('format', 'ndjson')
+    if export_format == 'ndjson':
+        response = StreamingHttpResponse(catalogue.iter_ndjson(), content_type='application/x-ndjson; charset=utf-8')
+        filename = 'melophile-catalogue.ndjson'
+    elif export_format == 'lrc':
+        response = StreamingHttpResponse(catalogue.iter_lrc_archive(), content_type='application/gzip')
+        filename = 'melophile-lyrics.tar.gz'
+    else:
+        return JsonResponse({'success': False, 'message': f'Unknown format: {export_format}'}, status=400)
+    
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+# Static assets: precompressed variants and far-future caching
+HASHED_NAME_PATTERN = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+STATIC_ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+def accepted_encodings(header):
+    """Content codings the client accepts (q > 0), from an Accept-Encoding header"""
+    qualities = {}
+    for item in header.split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+    
+    # "*" covers every coding not listed by name
+    wildcard = qualities.pop('*', 0.0)
+    return {name for name, _ in STATIC_ENCODINGS if qualities.get(name, wildcard) > 0}
+
+@require_http_methods(["GET", "HEAD"])
+def serve_static(request, path):
+    """Serve collected static files, preferring the precompressed .br/.gz copies"""
+    path = posixpath.normpath(path).lstrip('/')
+    
+    if settings.DEBUG:
+        # Development: straight from the app directories, nothing is hashed yet
+        absolute_path = finders.find(path)
+    else:
+        try:
+            absolute_path = safe_join(settings.STATIC_ROOT, path)
+        except ValueError:
+            raise Http404("Static file not found")
+    
+    if not absolute_path or not os.path.isfile(absolute_path):
+        raise Http404("Static file not found")
+    
+    # Pick the smallest variant the client accepts
+    accepted = accepted_encodings(request.headers.get('Accept-Encoding', ''))
+    encoding = None
+    served_path = absolute_path
+    for name, suffix in STATIC_ENCODINGS:
+        if name in accepted and os.path.isfile(absolute_path + suffix):
+            encoding = name
+            served_path = absolute_path + suffix
+            break
+    
+    stat = os.stat(served_path)
+    etag = f'"{int(stat.st_mtime):x}-{stat.st_size:x}-{encoding or "identity"}"'
+    if (request.headers.get('If-None-Match') == etag or
+            not was_modified_since(request.headers.get('If-Modified-Since'), stat.st_mtime)):
+        response = HttpResponseNotModified()
+    else:
+        content_type, _ = mimetypes.guess_type(absolute_path)
+        response = FileResponse(open(served_path, 'rb'), content_type=content_type or 'application/octet-stream')
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        if encoding:
+            response['Content-Encoding'] = encoding
+    
+    response['ETag'] = etag
+    response['Vary'] = 'Accept-Encoding'
+    if HASHED_NAME_PATTERN.search(path):
+        # The content hash is in the name, so the file can never change
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        response['Cache-Control'] = 'public, max-age=300'
+    return response
+
+# Media: byte ranges so the player can seek and start from partial reads
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+class FileRange:
+    """Read-only view of `length` bytes of an open file from `start`, streamed by FileResponse"""
+    
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+    
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+    
+    def close(self):
+        self.file.close()
+
+@require_http_methods(["GET", "HEAD"])
+def serve_media(request, path):
+    """Serve uploaded media with Range (206) and conditional request support"""
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        absolute_path = safe_join(settings.MEDIA_ROOT, path)
+    except ValueError:
+        raise Http404("Media file not found")
+    try:
+        # Cached for content-addressed files, so repeat requests skip the stat
+        metadata = caching.media_metadata(path, absolute_path)
+    except OSError:
+        raise Http404("Media file not found")
+    
+    size = metadata['size']
+    etag = metadata['etag']
+    if (request.headers.get('If-None-Match') == etag or
+            not was_modified_since(request.headers.get('If-Modified-Since'), metadata['mtime'])):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+    
+    content_type = metadata['content_type']
+    
+    match = RANGE_PATTERN.match(request.headers.get('Range', '').strip())
+    if match and (match.group(1) or match.group(2)):
+        first, last = match.groups()
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        else:
+            # Suffix range: the last N bytes
+            start = max(size - int(last), 0)
+            end = size - 1
+        
+        if start >= size or start > end:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        
+        try:
+            # Streamed in blocks: "bytes=0-" from <audio> asks for the whole file
+            ranged_file = FileRange(open(absolute_path, 'rb'), start, end - start + 1)
+        except OSError:
+            caching.forget_media(path)
+            raise Http404("Media file not found")
+        response = FileResponse(ranged_file, status=206, content_type=content_type)
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    else:
+        try:
+            response = FileResponse(open(absolute_path, 'rb'), content_type=content_type)
+        except OSError:
+            caching.forget_media(path)
+            raise Http404("Media file not found")
+    
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(metadata['mtime'])
+    response['Cache-Control'] = 'public, max-age=86400'
+    return response
@@ -41,6 +41,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'App.profiling.ProfilingMiddleware',  # First, so profiles cover the whole stack
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -82,6 +83,39 @@ DATABASES = {
 }
 
 
+# Caches
+# The rate limiter needs a store shared by all worker processes on the box
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'ratelimit': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, '.cache', 'ratelimit'),
+    },
+    # Shared by all workers and filled by `manage.py warm_caches`: normalized lyrics,
+    # rendered pages, media metadata. Requests only read it. Its table is created
+    # by the App migrations; point this at Redis/Memcached for large libraries.
+    'warm': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'melophile_warm_cache',
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': 1000000},
+    },
+    # Per process: what requests compute on a miss of the warm cache (lyrics, ...)
+    'local': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'melophile-local',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+WARM_CACHE = 'warm'
+LOCAL_CACHE = 'local'
+# Serve index pages from the warm cache (off while developing templates)
+CACHE_INDEX_PAGES = not DEBUG
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -122,3 +156,94 @@ STATIC_URL = '/static/'
 STATIC_ROOT=os.path.join(BASE_DIR, 'static')
 MEDIA_ROOT =os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
+# Django serves MEDIA_URL itself, DEBUG or not, with Range (206) and
+# ETag/Last-Modified support for seeking and for the next-track preload.
+# Set to False when the front-end server serves MEDIA_ROOT directly.
+SERVE_MEDIA = True
+
+# Uploads are stored under sharded content hashes (duplicates share a file);
+# hashed file names + .gz/.br copies for static files are written by collectstatic
+STORAGES = {
+    'default': {
+        'BACKEND': 'App.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'App.storage.CompressedManifestStaticFilesStorage',
+    },
+}
+
+# Third-party front-end libraries, self-hosted under App/static/vendor/.
+# `python manage.py vendor_assets` downloads any that are missing from `url`.
+# A missing copy is reported by the system checks (an error for check --deploy);
+# only with DEBUG on does the page load that library from its CDN url instead.
+VENDOR_ASSETS = {
+    'jquery.js': {
+        'path': 'vendor/jquery/jquery.min.js',
+        'url': 'https://cdnjs.cloudflare.com/ajax/libs/jquery/3.7.1/jquery.min.js',
+    },
+    'mediaelement.js': {
+        'path': 'vendor/mediaelement/mediaelement-and-player.js',
+        'url': 'https://cdnjs.cloudflare.com/ajax/libs/mediaelement/2.18.2/mediaelement-and-player.js',
+    },
+    'mediaelement.css': {
+        'path': 'vendor/mediaelement/mediaelementplayer.min.css',
+        'url': 'https://cdnjs.cloudflare.com/ajax/libs/mediaelement/2.18.2/mediaelementplayer.min.css',
+    },
+    'font-awesome.css': {
+        'path': 'vendor/font-awesome/css/font-awesome.min.css',
+        'url': 'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/4.7.0/css/font-awesome.min.css',
+    },
+}
+
+# Play tracking: events are kept in memory and written in one bulk insert
+# when the buffer fills up or after the flush interval (seconds)
+PLAY_EVENTS_BUFFER_SIZE = 100
+PLAY_EVENTS_FLUSH_INTERVAL = 10
+
+# Threads for background work (lyric alignment, catalogue jobs...)
+BACKGROUND_JOB_WORKERS = 2
+# Jobs whose key starts with one of these prefixes get their own threads, so a
+# backlog of lyric lookups cannot hold up the alignment jobs (and the other way round)
+BACKGROUND_JOB_POOLS = {
+    'lookup': 4,  # As many as MAX_CONCURRENT_LOOKUPS: more would only wait for a slot
+}
+
+# Rate limiting for endpoints that call the lyrics provider or write without
+# authentication: a token bucket per client IP (burst of `capacity`, refilled
+# `per_minute`). Anonymous listeners have no session, so there is no
+# per-session bucket.
+RATE_LIMIT_CACHE = 'ratelimit'
+# Reverse proxies (addresses or networks) whose X-Forwarded-For is believed.
+# Behind nginx every request comes from the proxy: list it here, or all
+# clients share one bucket.
+RATE_LIMIT_TRUSTED_PROXIES = []
+RATE_LIMITS = {
+    'fetch_lyrics': {'capacity': 5, 'per_minute': 6},
+    # A listener sends a few events per track (play, pause, resume, ended)
+    'play_event': {'capacity': 20, 'per_minute': 30},
+}
+# Provider lookups running at the same time across all processes
+MAX_CONCURRENT_LOOKUPS = 4
+# Lookups waiting for a slot before fetch_lyrics starts turning requests away
+MAX_PENDING_LOOKUPS = 50
+# Each open lyrics event stream holds a worker thread. Only pages for songs
+# without lyrics open one (a single stream per tab, also carrying the lookup it
+# started), and it closes on the song's first 'ready' event; otherwise after
+# this many seconds, when the browser reconnects
+LYRICS_STREAM_MAX_SECONDS = 55
+
+# Hit/miss counts per lyric query variant (App/query_stats.py), used to try the
+# most promising variant first; also broken down per artist when enabled
+LYRICS_QUERY_STATS_FILE = os.path.join(BASE_DIR, '.cache', 'lyrics_query_stats.json')
+LYRICS_QUERY_STATS_BY_ARTIST = True
+
+# Per-request profiling (App/profiling.py). When off the middleware removes
+# itself at startup. When on, requests with a token from `manage.py
+# profile_token` (X-Profile header or ?profile=) and a random share of
+# PROFILING_SAMPLE_RATE are profiled into PROFILING_DIR
+PROFILING_ENABLED = False
+PROFILING_SAMPLE_RATE = 0.0
+PROFILING_MODE = 'cprofile'  # Mode for sampled requests: 'cprofile' or 'sample'
+PROFILING_SAMPLE_INTERVAL = 0.005  # Seconds between stack samples in 'sample' mode
+PROFILING_TOKEN_MAX_AGE = 3600
+PROFILING_DIR = os.path.join(BASE_DIR, '.cache', 'profiles')
@@ -0,0 +1,51 @@
+# gunicorn.conf.py - Production server: preforked workers sharing a preloaded application
+#
+#   pip install gunicorn
+#   python manage.py migrate && python manage.py collectstatic --noinput
+#   gunicorn -c gunicorn.conf.py
+#
+# Tuned through the environment:
+#   MELOPHILE_BIND      address to listen on (default 0.0.0.0:8000)
+#   MELOPHILE_WORKERS   worker processes (default 2 x CPUs + 1)
+#   MELOPHILE_THREADS   threads per worker (default 4) - a page waiting for lyrics holds one for its event stream
+#   MELOPHILE_PRELOAD   load the app in the master before forking (default 1, 0 to disable)
+import multiprocessing
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Melophile.settings')
+
+wsgi_app = 'Melophile.wsgi:application'
+bind = os.environ.get('MELOPHILE_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('MELOPHILE_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('MELOPHILE_THREADS', 4))
+preload_app = os.environ.get('MELOPHILE_PRELOAD', '1') != '0'
+
+timeout = 60
+graceful_timeout = 30
+# Recycle workers now and then so slow leaks cannot add up (jitter avoids restarting all at once)
+max_requests = 5000
+max_requests_jitter = 500
+accesslog = '-'
+
+
+def when_ready(server):
+    """Master, application loaded, no worker forked yet"""
+    if preload_app:
+        from App.preload import preload
+        server.log.info("Preloaded application in %.2fs", preload())
+
+
+def post_worker_init(worker):
+    # Without preloading every worker warms up for itself, before its first request
+    if not preload_app:
+        from App.preload import preload
+        preload(freeze=False)
+
+
+def worker_exit(server, worker):
+    # Buffered play events and lyric query counts would otherwise be lost when a worker is recycled
+    from App import play_events
+    from App.views import save_query_stats
+    play_events.buffer.flush()
+    save_query_stats()
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Load generator for a whole listening session against a running Melophile server.
+
+Every virtual listener loops through: open a song page, stream the start of
+its audio with ranged reads, ask for lyrics, report a play event, listen for a
+while and move on to the next track. Concurrency is ramped in stages and each
+stage reports throughput, p50/p95/p99 latency and error rates per endpoint.
+
+/fetch-lyrics/ only queues the lookup and answers 202 with a ticket, so its
+own row measures the queueing. The "lyrics" row is what a listener waits for:
+from the POST to the ticket's event on /lyrics-events/. Lookups refused with a
+429, or given up because no provider slot freed up, count as throttled there.
+
+    (server started with loadtest.settings, see that module)
+    python -m loadtest.run --base-url http://127.0.0.1:8000 --stages 5,10,20,40
+"""
+import argparse
+import html
+import json
+import random
+import re
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from urllib.parse import urlencode, urljoin
+
+SONG_ID_PATTERN = re.compile(r'data-song-id="(\d+)"')
+AUDIO_PATTERN = re.compile(r'<source src="([^"]+)"')
+ARTIST_PATTERN = re.compile(r'<h3>(.*?)</h3>', re.S)
+TITLE_PATTERN = re.compile(r'<h1>(.*?)</h1>', re.S)
+NEXT_PAGE_PATTERN = re.compile(r'data-next-page="\?page=(\d+)"')
+
+
+class Stats:
+    """Thread-safe latency samples per (stage, endpoint)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(list)  # (stage, endpoint) -> [(seconds, status)]
+        self.stage = 0
+
+    def record(self, endpoint, seconds, status):
+        with self.lock:
+            self.samples[(self.stage, endpoint)].append((seconds, status))
+
+    def stage_samples(self, stage):
+        with self.lock:
+            return {endpoint: list(samples) for (s, endpoint), samples in self.samples.items() if s == stage}
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class Listener(threading.Thread):
+    """One simulated user listening to songs one after another"""
+
+    def __init__(self, options, stats, stop):
+        super().__init__(daemon=True)
+        self.options = options
+        self.stats = stats
+        self.stop = stop
+        self.page = random.randint(1, options.pages)
+
+    def request(self, endpoint, url, data=None, headers=None):
+        """Timed HTTP request; returns (status, body) and records the sample"""
+        request = urllib.request.Request(urljoin(self.options.base_url, url), data=data, headers=headers or {})
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=self.options.timeout) as response:
+                body = response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            body = e.read()
+            status = e.code
+        except (urllib.error.URLError, OSError):
+            body = b''
+            status = 0  # Connection error / timeout
+        self.stats.record(endpoint, time.perf_counter() - started, status)
+        return status, body
+
+    def run(self):
+        while not self.stop.is_set():
+            self.listen_to_track()
+
+    def listen_to_track(self):
+        status, body = self.request('index', f'/?page={self.page}')
+        if status != 200:
+            self.pause(1.0)
+            return
+        page = body.decode('utf-8', 'replace')
+
+        # Stream the start of the track the way the <audio> element does
+        audio = AUDIO_PATTERN.search(page)
+        if audio:
+            audio_url = html.unescape(audio.group(1))
+            chunk = self.options.range_size
+            for i in range(self.options.range_reads):
+                self.request('audio', audio_url, headers={'Range': f'bytes={i * chunk}-{(i + 1) * chunk - 1}'})
+
+        # Lyrics lookup against the (stubbed) provider
+        song_id = SONG_ID_PATTERN.search(page)
+        if random.random() < self.options.lyrics_ratio:
+            artist = ARTIST_PATTERN.search(page)
+            title = TITLE_PATTERN.search(page)
+            payload = {
+                'artist': html.unescape(artist.group(1).strip()) if artist else 'Unknown',
+                'title': html.unescape(title.group(1).strip()) if title else 'Unknown',
+            }
+            if song_id and self.options.save_lyrics:
+                payload['song_id'] = int(song_id.group(1))
+            self.fetch_lyrics(payload)
+
+        if song_id:
+            self.request('play_event', '/play-event/',
+                         json.dumps({'song_id': int(song_id.group(1)), 'event': 'play', 'position': 0}).encode(),
+                         {'Content-Type': 'application/json'})
+
+        self.pause(self.options.think_time)
+
+        # Next track, back to the first page after the last one
+        next_page = NEXT_PAGE_PATTERN.search(page)
+        self.page = int(next_page.group(1)) if next_page else 1
+
+    def fetch_lyrics(self, payload):
+        """Queue a lookup, then follow its ticket until the outcome arrives; records the whole wait"""
+        started = time.perf_counter()
+        status, body = self.request('fetch_lyrics', '/fetch-lyrics/', json.dumps(payload).encode(),
+                                    {'Content-Type': 'application/json'})
+        try:
+            answer = json.loads(body) if status == 202 else {}
+        except ValueError:
+            answer = {}
+        if not answer.get('ticket'):
+            # Refused (429 once MAX_PENDING_LOOKUPS are queued) or failed before queueing
+            self.stats.record('lyrics', time.perf_counter() - started, status if status != 202 else 500)
+            return
+
+        event = self.wait_for_ticket(answer['ticket'], answer.get('since'), started)
+        if event is None:
+            status = 0  # No outcome before --lyrics-timeout
+        elif event['status'] in ('ready', 'not_found'):
+            status = 200
+        elif 'busy' in (event.get('message') or ''):
+            status = 429  # Queued, then gave up waiting for a provider slot
+        else:
+            status = 500
+        self.stats.record('lyrics', time.perf_counter() - started, status)
+
+    def wait_for_ticket(self, ticket, since, started):
+        """Read the ticket's event stream (reconnecting like EventSource) until its event arrives"""
+        last_id = since
+        while time.perf_counter() - started < self.options.lyrics_timeout:
+            query = {'ticket': ticket}
+            if last_id is not None:
+                query['since'] = last_id
+            request = urllib.request.Request(urljoin(self.options.base_url, f'/lyrics-events/?{urlencode(query)}'),
+                                             headers={'Accept': 'text/event-stream'})
+            try:
+                with urllib.request.urlopen(request, timeout=self.options.timeout) as response:
+                    for line in response:
+                        if line.startswith(b'id: '):
+                            last_id = line[4:].strip().decode()
+                        elif line.startswith(b'data: '):
+                            event = json.loads(line[6:])
+                            if event.get('ticket') == ticket:
+                                return event
+            except (urllib.error.URLError, OSError, ValueError):
+                self.stop.wait(1)
+        return None
+
+    def pause(self, seconds):
+        self.stop.wait(random.uniform(0.5, 1.5) * seconds)
+
+
+def report(stage, concurrency, duration, samples, out=sys.stdout):
+    rows = {}
+    out.write(f"\n== Stage {stage + 1}: {concurrency} listeners, {duration:.0f}s ==\n")
+    out.write(f"{'endpoint':<14}{'requests':>9}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+              f"{'errors':>9}{'429s':>7}\n")
+    for endpoint in sorted(samples):
+        entries = samples[endpoint]
+        latencies = sorted(seconds * 1000 for seconds, _ in entries)
+        errors = sum(1 for _, status in entries if status == 0 or (status >= 400 and status != 429))
+        throttled = sum(1 for _, status in entries if status == 429)
+        row = {
+            'requests': len(entries),
+            'rps': len(entries) / duration,
+            'p50_ms': percentile(latencies, 50),
+            'p95_ms': percentile(latencies, 95),
+            'p99_ms': percentile(latencies, 99),
+            'error_rate': errors / len(entries),
+            'throttled': throttled,
+        }
+        rows[endpoint] = row
+        out.write(f"{endpoint:<14}{row['requests']:>9}{row['rps']:>9.1f}{row['p50_ms']:>9.0f}"
+                  f"{row['p95_ms']:>9.0f}{row['p99_ms']:>9.0f}{row['error_rate']:>8.1%}{throttled:>7}\n")
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Melophile listening-session load test")
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--stages', default='5,10,20', help='Comma-separated listener counts to ramp through')
+    parser.add_argument('--stage-duration', type=float, default=30, help='Seconds per stage')
+    parser.add_argument('--pages', type=int, default=5, help='Number of songs (pages) to spread listeners over')
+    parser.add_argument('--think-time', type=float, default=2.0, help='Mean seconds spent on a track')
+    parser.add_argument('--range-size', type=int, default=256 * 1024, help='Bytes per ranged audio read')
+    parser.add_argument('--range-reads', type=int, default=2, help='Ranged reads per track')
+    parser.add_argument('--lyrics-ratio', type=float, default=0.3, help='Share of tracks that fetch lyrics')
+    parser.add_argument('--save-lyrics', action='store_true', help='Send song_id so fetched lyrics are stored')
+    parser.add_argument('--lyrics-timeout', type=float, default=60,
+                        help='Seconds to wait for a lookup outcome on the event stream')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--json', help='Also write the results to this file')
+    options = parser.parse_args(argv)
+
+    stages = [int(n) for n in options.stages.split(',') if n.strip()]
+    stats = Stats()
+    stop = threading.Event()
+    listeners = []
+    results = []
+
+    print(f"Load testing {options.base_url} with stages {stages} ({options.stage_duration:.0f}s each)")
+    try:
+        for stage, concurrency in enumerate(stages):
+            stats.stage = stage
+            while len(listeners) < concurrency:
+                listener = Listener(options, stats, stop)
+                listener.start()
+                listeners.append(listener)
+
+            started = time.perf_counter()
+            time.sleep(options.stage_duration)
+            elapsed = time.perf_counter() - started
+            rows = report(stage, concurrency, elapsed, stats.stage_samples(stage))
+            results.append({'listeners': concurrency, 'duration': elapsed, 'endpoints': rows})
+    except KeyboardInterrupt:
+        print("\nInterrupted")
+    finally:
+        stop.set()
+
+    if options.json:
+        with open(options.json, 'w') as f:
+            json.dump({'base_url': options.base_url, 'stages': results}, f, indent=2)
+        print(f"\nResults written to {options.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+# settings.py - Load-test profile: production-like, with a stubbed lyrics provider
+#
+#   export DJANGO_SETTINGS_MODULE=loadtest.settings
+#   python manage.py collectstatic --noinput   # DEBUG is off, the manifest is required
+#   python manage.py runserver --noreload      # or any WSGI server with these settings
+import os
+
+from Melophile.settings import *  # noqa: F401,F403
+
+DEBUG = False
+CACHE_INDEX_PAGES = True
+ALLOWED_HOSTS = ['*']
+
+# Never call the real provider from a load test
+LYRICS_PROVIDER = 'loadtest.stub_provider.search'
+
+# Stub results would skew the real query variant statistics
+LYRICS_QUERY_STATS_FILE = os.path.join(BASE_DIR, '.cache', 'loadtest_query_stats.json')  # noqa: F405
+
+# One machine generates all the traffic - keep the per-client limits out of the way,
+# but leave the global lookup cap as configured so it is part of the measurement
+RATE_LIMITS = {
+    'fetch_lyrics': {'capacity': 1000000, 'per_minute': 1000000},
+    'play_event': {'capacity': 1000000, 'per_minute': 1000000},
+}
+
+# Point at a copy of the database / media when the real ones must stay untouched
+if os.environ.get('LOADTEST_DATABASE'):
+    DATABASES['default']['NAME'] = os.environ['LOADTEST_DATABASE']  # noqa: F405
+if os.environ.get('LOADTEST_MEDIA_ROOT'):
+    MEDIA_ROOT = os.environ['LOADTEST_MEDIA_ROOT']
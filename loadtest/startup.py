@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark: import time of the application and resident memory per worker.
+
+Measures, for each configuration:
+  - how long importing and preloading the application takes (python -X importtime),
+    with the packages that take longest to import;
+  - gunicorn (gunicorn.conf.py) from launch to the first successful response;
+  - RSS, PSS and shared memory of the master and of every worker after some traffic.
+    PSS splits shared pages between the processes using them, so the PSS total is
+    what the server really costs - that is where preloading shows.
+
+Linux only (reads /proc). Runs against DJANGO_SETTINGS_MODULE as set; with DEBUG
+off the static manifest must exist first, e.g.
+
+    export DJANGO_SETTINGS_MODULE=loadtest.settings LOADTEST_DATABASE=/tmp/copy.sqlite3
+    python manage.py collectstatic --noinput
+    python -m loadtest.startup --workers 4 --compare
+"""
+import argparse
+import json
+import os
+import re
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|\s*(\S+)')
+IMPORT_SCRIPT = (
+    "import time; started = time.perf_counter()\n"
+    "import Melophile.wsgi\n"
+    "from App.preload import preload; preload()\n"
+    "print(time.perf_counter() - started)\n"
+)
+
+
+def measure_imports(top=10):
+    """Seconds to import and preload the app in a fresh interpreter, and the slowest imports"""
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'Melophile.settings'))
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', IMPORT_SCRIPT],
+                            cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    seconds = float(result.stdout.strip().splitlines()[-1])
+
+    # Own ("self") time of every module, summed per top-level package
+    packages = {}
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            package = match.group(3).split('.')[0]
+            packages[package] = packages.get(package, 0) + int(match.group(1))
+    slowest = sorted(packages.items(), key=lambda item: -item[1])[:top]
+    return {'seconds': seconds, 'slowest_imports_ms': [(name, us / 1000) for name, us in slowest]}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def children(pid):
+    found = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # The process name may contain spaces: the parent pid follows the closing parenthesis
+                if int(f.read().rsplit(')', 1)[1].split()[1]) == pid:
+                    found.append(int(entry))
+        except (OSError, IndexError, ValueError):
+            continue
+    return sorted(found)
+
+
+def memory(pid):
+    """RSS, PSS and shared memory of a process in MB"""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                values[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return {
+        'rss_mb': values.get('Rss', 0.0),
+        'pss_mb': values.get('Pss', 0.0),
+        'shared_mb': values.get('Shared_Clean', 0.0) + values.get('Shared_Dirty', 0.0),
+    }
+
+
+def measure_server(workers, preload, path='/', requests=50, timeout=60):
+    port = free_port()
+    env = dict(os.environ, MELOPHILE_BIND=f'127.0.0.1:{port}', MELOPHILE_WORKERS=str(workers),
+               MELOPHILE_PRELOAD='1' if preload else '0')
+    url = f'http://127.0.0.1:{port}{path}'
+
+    started = time.perf_counter()
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py'], cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        first_response = None
+        while first_response is None:
+            if server.poll() is not None:
+                raise RuntimeError(f"gunicorn exited with status {server.returncode}")
+            if time.perf_counter() - started > timeout:
+                raise RuntimeError("gunicorn did not answer in time")
+            try:
+                with urllib.request.urlopen(url, timeout=5) as response:
+                    response.read()
+                first_response = time.perf_counter() - started
+            except urllib.error.HTTPError as e:
+                # The server is up but the page is broken - waiting will not fix that
+                raise RuntimeError(f"GET {path} answered {e.code} {e.reason}") from None
+            except (urllib.error.URLError, OSError):
+                time.sleep(0.05)
+
+        # Let every worker serve something before looking at its memory
+        for _ in range(requests):
+            with urllib.request.urlopen(url, timeout=10) as response:
+                response.read()
+
+        worker_pids = children(server.pid)
+        workers_memory = [memory(pid) for pid in worker_pids]
+        master = memory(server.pid)
+        return {
+            'workers': workers,
+            'preload': preload,
+            'first_response_s': first_response,
+            'master': master,
+            'per_worker': workers_memory,
+            'total_pss_mb': master['pss_mb'] + sum(m['pss_mb'] for m in workers_memory),
+        }
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def report(result, out=sys.stdout):
+    label = 'preloaded' if result['preload'] else 'not preloaded'
+    out.write(f"\n== {result['workers']} workers, {label} ==\n")
+    out.write(f"first response after {result['first_response_s']:.2f}s\n")
+    out.write(f"{'process':<10}{'RSS MB':>9}{'PSS MB':>9}{'shared MB':>11}\n")
+    rows = [('master', result['master'])] + [(f'worker {i + 1}', m) for i, m in enumerate(result['per_worker'])]
+    for name, m in rows:
+        out.write(f"{name:<10}{m['rss_mb']:>9.1f}{m['pss_mb']:>9.1f}{m['shared_mb']:>11.1f}\n")
+    out.write(f"{'total PSS':<10}{result['total_pss_mb']:>18.1f}\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Melophile cold-start and memory benchmark")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--path', default='/', help='URL requested to check the workers are up')
+    parser.add_argument('--requests', type=int, default=50, help='Requests sent before measuring memory')
+    parser.add_argument('--compare', action='store_true', help='Also run without preloading')
+    parser.add_argument('--json', help='Also write the results to this file')
+    options = parser.parse_args(argv)
+
+    imports = measure_imports()
+    print(f"Import + preload: {imports['seconds']:.2f}s")
+    for name, ms in imports['slowest_imports_ms']:
+        print(f"  {name:<24}{ms:>8.1f} ms")
+
+    results = []
+    for preload in ([True, False] if options.compare else [True]):
+        result = measure_server(options.workers, preload, options.path, options.requests)
+        report(result)
+        results.append(result)
+
+    if options.json:
+        with open(options.json, 'w') as f:
+            json.dump({'imports': imports, 'servers': results}, f, indent=2)
+        print(f"\nResults written to {options.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,22 @@
+# stub_provider.py - Stand-in for syncedlyrics.search with a realistic delay
+import os
+import random
+import time
+
+# Seconds a provider round trip takes (mean, jitter)
+LATENCY = float(os.environ.get('LOADTEST_PROVIDER_LATENCY', '0.4'))
+JITTER = float(os.environ.get('LOADTEST_PROVIDER_JITTER', '0.2'))
+# Share of queries that find nothing, so the fallback variants get exercised too
+MISS_RATE = float(os.environ.get('LOADTEST_PROVIDER_MISS_RATE', '0.5'))
+
+
+def search(query):
+    time.sleep(max(0.0, random.uniform(LATENCY - JITTER, LATENCY + JITTER)))
+    if random.random() < MISS_RATE:
+        return None
+
+    lines = []
+    for i in range(40):
+        seconds = 10 + i * 4.5
+        lines.append(f"[{int(seconds) // 60:02d}:{seconds % 60:05.2f}] {query} line {i + 1}")
+    return '\n'.join(lines)
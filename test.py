@@ -11,6 +11,11 @@ import os
 import sys
 from datetime import datetime
 
+from App.query_stats import QueryStats, VARIANTS, build_query, is_hit
+
+# Shared with the Django app, so lookups from either side improve the ordering
+QUERY_STATS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'lyrics_query_stats.json')
+
 class LyricsFetcher:
     def __init__(self):
         self.session_stats = {
@@ -19,6 +24,7 @@ class LyricsFetcher:
             'failed_fetches': 0,
             'songs': []
         }
+        self.query_stats = QueryStats(QUERY_STATS_FILE)
     
     def search_lyrics(self, artist, title, save_to_file=False, show_preview=True):
         """
@@ -30,41 +36,44 @@ class LyricsFetcher:
         
         self.session_stats['total_searched'] += 1
         
-        # Try different query variations for better results
-        queries = [
-            f"{artist} {title}",
-            f"{title} {artist}",
-            f"{artist} - {title}",
-            f'"{artist}" "{title}"',
-            title,  # Sometimes just the title works better
-            f"{title} lyrics"
-        ]
+        # Try the query variations that worked best so far first
+        variants = self.query_stats.order(list(VARIANTS), artist, title)
         
         lrc_data = None
         successful_query = None
         
-        for i, query in enumerate(queries, 1):
-            print(f"📡 Attempt {i}/{len(queries)}: {query}")
+        for i, variant in enumerate(variants, 1):
+            query = build_query(variant, artist, title)
+            print(f"📡 Attempt {i}/{len(variants)}: {query}")
             
             try:
                 lrc_data = syncedlyrics.search(query)
                 
-                if lrc_data and len(lrc_data.strip()) > 50:  # Ensure substantial content
-                    # Quick validation - check if it contains timestamp patterns
-                    if re.search(r'\[\d+:\d+[\.\:]\d+\]', lrc_data):
-                        print(f"✅ SUCCESS with query: {query}")
-                        successful_query = query
-                        break
-                    else:
-                        print(f"⚠️  Found text but no timestamps")
-                        continue
+                # Same hit definition as the web app: both write the same stats file
+                if is_hit(lrc_data):
+                    print(f"✅ SUCCESS with query: {query}")
+                    self.query_stats.record(variant, artist, title, True)
+                    successful_query = query
+                    break
+                elif lrc_data:
+                    print(f"⚠️  Found text but no timestamps")
+                    self.query_stats.record(variant, artist, title, False)
+                    continue
                 else:
                     print(f"❌ No results")
+                    self.query_stats.record(variant, artist, title, False)
                     
             except Exception as e:
                 print(f"💥 Error: {e}")
+                self.query_stats.record(variant, artist, title, False)
                 continue
         
+        self.query_stats.record_lookup(i if variants else 0, successful_query is not None)
+        try:
+            self.query_stats.save()
+        except OSError as e:
+            print(f"⚠️  Could not save query stats: {e}")
+        
         if not lrc_data:
             print(f"\n❌ NO SYNCED LYRICS FOUND")
             print("💡 Try:")
@@ -309,6 +318,10 @@ class LyricsFetcher:
             success_rate = (stats['successful_fetches'] / stats['total_searched']) * 100
             print(f"Success rate: {success_rate:.1f}%")
         
+        lookups = self.query_stats.summary()['lookups']
+        if lookups['count']:
+            print(f"Provider calls per lookup (all time): {lookups['calls_per_lookup']:.2f}")
+        
         if stats['songs']:
             print(f"\n📋 Song Results:")
             for song in stats['songs']: